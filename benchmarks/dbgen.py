@@ -0,0 +1,93 @@
+"""
+Generate synthetic deemon databases for benchmarking.
+
+Artist IDs run from 1 to the number of artists. Releases are stored under
+album IDs derived from the artist ID and the release's position in the
+replayed discography (see album_id) so that a refresh finds up to
+NEW_PER_ARTIST new releases for every artist.
+"""
+import random
+import time
+from datetime import date, timedelta
+
+from deemon.core.db import Database
+
+# Releases in each replayed discography that are not stored in the database
+NEW_PER_ARTIST = 2
+
+# Monitored artists added per transaction
+ARTISTS_PER_TRANSACTION = 100
+
+BATCH_SIZE = 50000
+
+
+def album_id(artist_id: int, position: int) -> int:
+    return artist_id * 100000 + position
+
+
+def chunked(rows, size: int = BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(artists: int, releases: int, seed: int = 1) -> dict:
+    """
+    Populate the current deemon database, which must be empty, with
+    monitored artists, their releases and the transactions that added them
+    """
+    rnd = random.Random(seed)
+    now = int(time.time())
+    today = date.today()
+    transactions = max(1, -(-artists // ARTISTS_PER_TRANSACTION))
+    per_artist, remainder = divmod(releases, artists)
+
+    db = Database()
+
+    db.cursor.executemany(
+        "INSERT INTO transactions (id, timestamp, profile_id) VALUES (?, ?, 1)",
+        [(tid, now - (transactions - tid) * 3600) for tid in range(1, transactions + 1)]
+    )
+
+    def monitor_rows():
+        for artist_id in range(1, artists + 1):
+            trans_id = (artist_id - 1) // ARTISTS_PER_TRANSACTION + 1
+            yield artist_id, f"Artist {artist_id:06d}", trans_id
+
+    for batch in chunked(monitor_rows()):
+        db.cursor.executemany(
+            "INSERT INTO monitor (artist_id, artist_name, profile_id, refreshed, trans_id) VALUES (?, ?, 1, 1, ?)",
+            batch
+        )
+
+    def release_rows():
+        for artist_id in range(1, artists + 1):
+            count = per_artist + (1 if artist_id <= remainder else 0)
+            trans_ids = (artist_id - 1) // ARTISTS_PER_TRANSACTION + 1, rnd.randint(1, transactions)
+            for position in range(NEW_PER_ARTIST, NEW_PER_ARTIST + count):
+                future = rnd.random() < 0.01
+                if future:
+                    release_date = today + timedelta(days=rnd.randint(1, 120))
+                else:
+                    release_date = today - timedelta(days=rnd.randint(0, 7300))
+                yield (artist_id, f"Artist {artist_id:06d}", album_id(artist_id, position),
+                       f"Release {position}", release_date.isoformat(), now - rnd.randint(0, 94608000),
+                       rnd.choice((0, 0, 1)), rnd.choice(("single", "album", "ep")), int(future),
+                       rnd.choice(trans_ids))
+
+    for batch in chunked(release_rows()):
+        db.cursor.executemany(
+            "INSERT INTO releases (artist_id, artist_name, album_id, album_name, album_release, album_added, "
+            "explicit, record_type, profile_id, future_release, trans_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?)",
+            batch
+        )
+
+    db.query("ANALYZE")
+    db.commit()
+    return {'artists': artists, 'releases': releases, 'transactions': transactions}
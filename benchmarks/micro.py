@@ -0,0 +1,199 @@
+"""
+Benchmarks that don't depend on the size of the deemon database. Each runs
+against an empty database and returns its duration in seconds, optionally
+with extra details to report; see run.py.
+"""
+import copy
+import json
+import random
+import re
+import subprocess
+import sys
+import time
+from functools import partial
+
+# Modules cli.py must not import until a command needs them
+LAZY_MODULES = ("deemix", "deezer", "plexapi", "mutagen", "unidecode", "requests", "aiohttp")
+
+WORDS = ("night", "echo", "gold", "river", "static", "glass", "summer", "ghost", "signal", "paper", "horizon",
+         "fire", "blue", "wild", "neon", "hollow", "city", "heart", "dream", "stone")
+
+VERSIONS = ("Live", "Remix", "Radio Edit", "Acoustic", "Remastered", "Instrumental", "Demo", "Extended Mix",
+            "Deluxe Edition", "Clean")
+
+STARTUP_SCRIPT = """
+import json, sys
+import deemon.cli
+print(json.dumps([m for m in {modules!r} if m in sys.modules]))
+"""
+
+
+def bench_startup(ctx):
+    """ Import time of deemon.cli as reported by python -X importtime """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT.format(modules=LAZY_MODULES)],
+                            capture_output=True, text=True, check=True, cwd=ctx['repo'])
+    cumulative = None
+    for line in result.stderr.splitlines():
+        fields = [x.strip() for x in line.split("|")]
+        if len(fields) == 3 and fields[2] == "deemon.cli":
+            cumulative = int(fields[1])
+    eager = json.loads(result.stdout)
+    failures = [f"deemon.cli imports {x}, which should only be imported by the commands using it" for x in eager]
+    return cumulative / 1e6, {'eager_imports': eager, 'failures': failures}
+
+
+def bench_help(ctx):
+    """ Wall time of `deemon --help`, as run by cron before any work is done """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "deemon", "--help"], capture_output=True, check=True, cwd=ctx['repo'])
+    return time.perf_counter() - start
+
+
+def exclusion_rules(count: int, rnd: random.Random) -> tuple:
+    patterns = []
+    for i in range(count):
+        word = rnd.choice(WORDS)
+        version = rnd.choice(VERSIONS)
+        patterns.append(rf"(?i)\b{word}\b.*\({re.escape(version)}{i}\)" if i % 2 else rf"\[{word}{i}\]")
+    keywords = [f"{v.lower()}{i}" for i, v in enumerate(VERSIONS)]
+    return tuple(patterns), tuple(keywords)
+
+
+def exclusion_titles(count: int, rnd: random.Random) -> list:
+    titles = []
+    for _ in range(count):
+        title = " ".join(rnd.choice(WORDS).title() for _ in range(rnd.randint(1, 4)))
+        if rnd.random() < 0.3:
+            title += f" ({rnd.choice(VERSIONS)}{rnd.randint(0, 400)})"
+        titles.append({'title': title})
+    return titles
+
+
+def bench_exclusion_compile(ctx, patterns: int = 200):
+    """ Build an ExclusionMatcher from 200 patterns """
+    from deemon.core.common import ExclusionMatcher
+    rules = exclusion_rules(patterns, random.Random(ctx['seed']))
+    start = time.perf_counter()
+    ExclusionMatcher(*rules)
+    return time.perf_counter() - start
+
+
+def bench_exclusion_match(ctx, patterns: int = 200, titles: int = 500000):
+    """ Filter 500k titles with an ExclusionMatcher of 200 patterns """
+    from deemon.core.common import ExclusionMatcher
+    rnd = random.Random(ctx['seed'])
+    matcher = ExclusionMatcher(*exclusion_rules(patterns, rnd))
+    albums = exclusion_titles(titles, rnd)
+    start = time.perf_counter()
+    allowed = matcher.filter(albums)
+    return time.perf_counter() - start, {'titles': titles, 'patterns': patterns, 'excluded': titles - len(allowed)}
+
+
+def discography(count: int, rnd: random.Random) -> list:
+    """
+    Return a discography of count releases in which each title has several
+    editions: explicit and clean versions and editions with bonus tracks
+    """
+    today = time.time()
+    releases = []
+    for i in range(count):
+        title = f"Release {i // 4:05d}"
+        age = rnd.randint(0, 3650) if i // 4 % 50 else rnd.randint(0, 30)
+        releases.append({
+            'id': 10000000 + i,
+            'title': title,
+            'release_date': time.strftime("%Y-%m-%d", time.localtime(today - age * 86400)),
+            'explicit_lyrics': 1 if i % 4 == 0 and rnd.random() < 0.5 else rnd.choice((0, 2, 3)),
+            'record_type': rnd.choice(("album", "single", "ep")) if i % 4 == 0 else None,
+            'nb_tracks': rnd.randint(1, 20),
+            'cover_big': "",
+            'link': f"https://www.deezer.com/album/{10000000 + i}",
+        })
+    # Editions of a title share its record type
+    for i, release in enumerate(releases):
+        release['record_type'] = releases[i - i % 4]['record_type']
+    return releases
+
+
+def bench_filter_releases(ctx, releases: int):
+    """ Choose explicit versions and preferred editions for one large discography """
+    from deemon.cmd.refresh import Refresh
+    payload = {'artist_id': 1, 'artist_name': "Artist 000001", 'bitrate': None, 'download_path': None,
+               'alerts': None, 'record_type': "all", 'refreshed': 1,
+               'releases': discography(releases, random.Random(ctx['seed']))}
+    refresh = Refresh(skip_download=True, active_api=ctx['api'])
+    start = time.perf_counter()
+    refresh.filter_artist_releases(payload)
+    return time.perf_counter() - start, {'releases': releases, 'queued': len(refresh.queue_list)}
+
+
+def bench_playlist_generation(ctx, tracks: int = 5000):
+    """
+    Generate the deemix download object of a 5,000 track playlist, half of
+    whose tracks were already downloaded
+    """
+    from deemon.core.db import Database
+    from deemon.core.dmi import DeemixInterface
+
+    class StubAPI:
+        @staticmethod
+        def get_artist(artist_id):
+            return {'id': artist_id, 'name': "Various Artists"}
+
+    class StubDeezer:
+        api = StubAPI()
+
+    db = Database()
+    db.cursor.executemany("INSERT INTO playlist_tracks (track_id, playlist_id, profile_id) VALUES (?, 1, 1)",
+                          [(x,) for x in range(1, tracks + 1, 2)])
+    db.commit()
+    playlist = {'id': 1, 'title': "Playlist", 'creator': {'name': "deemon"},
+                'picture_small': "https://e-cdns-images.dzcdn.net/images/playlist/0/56x56-000000-80-0-0.jpg"}
+    playlist_tracks = [{'SNG_ID': str(x), 'SNG_TITLE': f"Track {x}", 'ART_ID': "1", 'ART_NAME': "Artist 000001",
+                        'ALB_ID': "1", 'ALB_TITLE': "Album", 'ALB_PICTURE': "", 'DURATION': "200",
+                        'EXPLICIT_LYRICS': "0", 'MEDIA': [{'HREF': ""}]} for x in range(1, tracks + 1)]
+    di = DeemixInterface()
+    start = time.perf_counter()
+    di.generatePlaylistItem(StubDeezer(), 1, 1, playlistAPI=playlist, playlistTracksAPI=playlist_tracks)
+    return time.perf_counter() - start, {'tracks': tracks, 'known_tracks': len(range(1, tracks + 1, 2))}
+
+
+def bench_api_parity(ctx, artists: int = 1000):
+    """
+    Fetch discographies, artists and searches through the async backend and
+    check the results match those of the threaded backend
+    """
+    import replay
+    try:
+        async_api = replay.AsyncReplayAPI(ctx['fixtures'], ctx['server'])
+    except ImportError as e:
+        return 0.0, {'skipped': f"async backend unavailable: {e}"}
+    threaded_api = replay.ReplayAPI(ctx['fixtures'])
+    calls = [
+        ('get_artist_albums', [{'artist_id': i, 'artist_name': f"Artist {i:06d}"} for i in range(1, artists + 1)]),
+        ('get_artist_by_id', list(range(1, 101))),
+        ('search_artist', [f"Artist {i:06d}" for i in range(1, 101)]),
+    ]
+    start = time.perf_counter()
+    results = {name: async_api.fetch_all(getattr(async_api, name), copy.deepcopy(items), name) for name, items in calls}
+    elapsed = time.perf_counter() - start
+
+    failures = []
+    for name, items in calls:
+        expected = threaded_api.fetch_all(getattr(threaded_api, name), copy.deepcopy(items), name)
+        mismatched = sum(1 for a, b in zip(results[name], expected) if a != b)
+        if mismatched:
+            failures.append(f"async {name} differs from the threaded backend for {mismatched} of {len(items)} item(s)")
+    return elapsed, {'artists': artists, 'failures': failures}
+
+
+MICRO_BENCHMARKS = {
+    'startup': bench_startup,
+    'help': bench_help,
+    'exclusion_compile': bench_exclusion_compile,
+    'exclusion_match': bench_exclusion_match,
+    'filter_releases_2k': partial(bench_filter_releases, releases=2000),
+    'filter_releases_5k': partial(bench_filter_releases, releases=5000),
+    'playlist_generation': bench_playlist_generation,
+    'api_parity': bench_api_parity,
+}
@@ -0,0 +1,72 @@
+"""
+Check that the queries behind hot Database methods use indexes.
+
+Each method is called for real while the SQL it runs is captured, then every
+captured query is run through EXPLAIN QUERY PLAN. A step that scans a whole
+table without an index is reported as a failure.
+"""
+import re
+import time
+from unittest import mock
+
+from deemon.core.db import Database
+
+# A full table scan, as opposed to "SCAN t USING [COVERING] INDEX ..."
+FULL_SCAN_REGEX = re.compile(r'^SCAN (?!.*\bUSING\b.*\bINDEX\b)(?!CONSTANT)(\w+)')
+LIMIT_REGEX = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+
+
+def hot_queries(artists: int) -> list:
+    """ Return (name, method, args) of the Database calls to check """
+    now = int(time.time())
+    return [
+        ("get_monitored_artist_by_id", Database.get_monitored_artist_by_id, (artists // 2,)),
+        ("get_monitored_artist_by_name", Database.get_monitored_artist_by_name, (f"Artist {artists // 2:06d}",)),
+        ("get_playlist_tracks", Database.get_playlist_tracks, (1,)),
+        ("get_playlist_track_ids", Database.get_playlist_track_ids, (1,)),
+        ("show_new_releases", Database.show_new_releases, (now - 30 * 86400, now)),
+        ("get_future_releases", Database.get_future_releases, ()),
+        ("get_transactions", Database.get_transactions, ()),
+        ("rollback_last_refresh", Database.rollback_last_refresh, (1,)),
+        ("rollback_refresh", Database.rollback_refresh, (1,)),
+    ]
+
+
+def capture(method, *args) -> list:
+    """ Call a Database method and return the (sql, values) it executed """
+    captured = []
+    query, query_tuples = Database.query, Database.query_tuples
+
+    def recording(original):
+        def wrapper(self, sql, values=None):
+            captured.append((sql, values or {}))
+            return original(self, sql, values)
+        return wrapper
+
+    db = Database()
+    with mock.patch.object(Database, 'query', recording(query)), \
+            mock.patch.object(Database, 'query_tuples', recording(query_tuples)):
+        with db.transaction():
+            method(db, *args)
+            # Leave the database unchanged for the benchmarks that follow
+            db.conn.rollback()
+    return captured
+
+
+def check(artists: int) -> list:
+    """ Return the query plan of every hot query and whether it scans a whole table """
+    db = Database()
+    results = []
+    for name, method, args in hot_queries(artists):
+        checked = set()
+        for sql, values in capture(method, *args):
+            if sql in checked:
+                continue
+            checked.add(sql)
+            plan = [row[3] for row in db.query_tuples(f"EXPLAIN QUERY PLAN {sql}", values)]
+            scans = [m.group(1) for m in (FULL_SCAN_REGEX.match(x) for x in plan) if m]
+            if LIMIT_REGEX.search(sql) and not any("TEMP B-TREE FOR ORDER BY" in x for x in plan):
+                # Rows are read in the order requested, so the scan stops at the limit
+                scans = []
+            results.append({'method': name, 'query': sql, 'plan': plan, 'full_scans': scans})
+    return results
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Record GW discography responses for replay by the benchmarks.
+
+    python benchmarks/record.py --arl ARL 27 4050205 -o fixtures/mine.json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from deezer import Deezer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record artist discographies from the GW API")
+    parser.add_argument('artist_ids', nargs="+", type=int, metavar="ARTIST_ID")
+    parser.add_argument('--arl', required=True, help="ARL used to log in to Deezer")
+    parser.add_argument('-o', '--output', type=Path, required=True, metavar="FILE")
+    args = parser.parse_args(argv)
+
+    dz = Deezer()
+    if not dz.login_via_arl(args.arl):
+        sys.exit("Unable to login to Deezer using ARL")
+
+    fixtures = {}
+    for artist_id in args.artist_ids:
+        fixtures[str(artist_id)] = dz.gw.get_artist_discography(art_id=artist_id, limit=-1)
+        print(f"Recorded {len(fixtures[str(artist_id)]['data'])} release(s) for artist {artist_id}",
+              file=sys.stderr)
+
+    with open(args.output, 'w', encoding='utf8') as f:
+        json.dump(fixtures, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
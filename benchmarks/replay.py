@@ -0,0 +1,158 @@
+"""
+Replay recorded GW API responses in place of Deezer.
+
+Fixtures map a Deezer artist ID to the response of
+gw.get_artist_discography for that artist. Each synthetic artist is served
+one of the recorded discographies, with artist and album IDs rewritten so
+that releases are unique per artist.
+
+ReplayAPI serves them to the threaded PlatformAPI directly. For the async
+backend, ReplayServer answers GW requests over HTTP on localhost and
+AsyncReplayAPI points AsyncPlatformAPI at it.
+"""
+import copy
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from deemon.core import api, ratelimit
+from deemon.core.config import Config as config
+
+from dbgen import album_id
+
+
+def load_fixtures(path) -> dict:
+    with open(path, 'r', encoding='utf8') as f:
+        return json.load(f)
+
+
+class ReplayGW:
+    """ Stand-in for deezer.gw.GW serving recorded discographies """
+
+    def __init__(self, fixtures: dict, latency: float = 0):
+        self.discographies = list(fixtures.items())
+        self.latency = latency
+
+    def get_artist(self, art_id):
+        if self.latency:
+            time.sleep(self.latency)
+        return {'ART_ID': str(art_id), 'ART_NAME': f"Artist {int(art_id):06d}"}
+
+    def search(self, query, index=0, limit=10, suggest=True, artist_suggest=True, top_tracks=True):
+        """ Match names in the form used by synthetic databases, 'Artist 000001' """
+        if self.latency:
+            time.sleep(self.latency)
+        prefix, _, art_id = query.partition(" ")
+        artists = []
+        if prefix == "Artist" and art_id.isdigit():
+            artists.append({'ART_ID': str(int(art_id)), 'ART_NAME': query})
+        return {'ARTIST': {'data': artists, 'count': len(artists), 'total': len(artists)}}
+
+    def get_artist_discography(self, art_id, index=0, limit=25):
+        if self.latency:
+            time.sleep(self.latency)
+        recorded_id, response = self.discographies[int(art_id) % len(self.discographies)]
+        response = copy.deepcopy(response)
+        for position, release in enumerate(response['data']):
+            if release['ART_ID'] == recorded_id:
+                release['ART_ID'] = str(art_id)
+            release['ALB_ID'] = str(album_id(int(art_id), position))
+        return response
+
+
+class ReplayAPI(api.PlatformAPI):
+    """ PlatformAPI using the GW code path without a Deezer session """
+
+    def __init__(self, fixtures: dict, latency: float = 0):
+        self.max_threads = min(max(config.fast_api_threads(), 1), 50)
+        self.dz = None
+        self.platform = "deezer-gw"
+        self.account_type = "premium"
+        self.api = ReplayGW(fixtures, latency)
+        self.limiter = ratelimit.get_limiter(self.max_threads)
+        self.cache = None
+
+
+class ReplayServer:
+    """ Serve ReplayGW responses to the GW methods used by AsyncPlatformAPI over HTTP """
+
+    def __init__(self, fixtures: dict, latency: float = 0):
+        gw = ReplayGW(fixtures, latency)
+        methods = {
+            'deezer.getUserData': lambda args: {'checkForm': "replay"},
+            'album.getDiscography': lambda args: gw.get_artist_discography(args['ART_ID'], limit=args.get('nb')),
+            'artist.getData': lambda args: gw.get_artist(args['ART_ID']),
+            'deezer.pageSearch': lambda args: gw.search(args['query']),
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive like the Deezer API does
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                method = parse_qs(urlparse(self.path).query)['method'][0]
+                args = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+                if method in methods:
+                    body = {'error': [], 'results': methods[method](args)}
+                else:
+                    body = {'error': {'METHOD_NOT_FOUND': method}, 'results': {}}
+                self.reply(body)
+
+            def do_GET(self):
+                self.reply({'error': {'code': 800, 'message': "Only GW requests are replayed"}})
+
+            def reply(self, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', "application/json")
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class DummySession:
+    """ Stand-in for the deezer.Deezer session AsyncPlatformAPI reads headers from """
+    http_headers = {}
+
+
+def AsyncReplayAPI(fixtures: dict, server: ReplayServer, latency: float = 0):
+    """
+    Return an AsyncPlatformAPI requesting GW methods from server instead of
+    Deezer. Requires aiohttp.
+    """
+    from deemon.core import aioapi
+
+    class _AsyncReplayAPI(aioapi.AsyncPlatformAPI):
+        GW_URL = server.url + "ajax/gw-light.php"
+        API_URL = server.url
+
+        def __init__(self):
+            self.max_threads = min(max(config.fast_api_threads(), 1), 50)
+            self.dz = DummySession()
+            self.platform = "deezer-gw"
+            self.account_type = "premium"
+            # Methods without an async version use the threaded code path
+            self.api = ReplayGW(fixtures, latency)
+            self.cache = None
+            self.max_concurrency = config.async_api_concurrency()
+            self.limiter = ratelimit.get_limiter(self.max_concurrency)
+            self.session = None
+            self.gw_token = None
+            self.gw_token_lock = None
+
+    return _AsyncReplayAPI()
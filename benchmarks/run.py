@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for deemon.
+
+Builds synthetic databases, replays recorded API responses instead of calling
+Deezer and writes timings as JSON. Runs against a temporary appdata directory
+so an existing deemon configuration and database are never touched.
+
+    python benchmarks/run.py --artists 1000 --releases 20000 -o results.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import micro
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+DEFAULT_FIXTURES = BENCHMARK_DIR / "fixtures" / "gw_discography.json"
+
+# Benchmark the working tree rather than an installed copy of deemon
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+
+@contextlib.contextmanager
+def quiet():
+    """ Hide progress bars and command output while timing """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):
+        yield
+
+
+def bench_refresh(ctx):
+    from deemon.cmd.refresh import Refresh
+    refresh = Refresh(skip_download=True, full_refresh=True, active_api=ctx['api'])
+    start = time.perf_counter()
+    refresh.run()
+    return time.perf_counter() - start
+
+
+def bench_seen_diff(ctx):
+    """ Load album IDs already seen and remove them from every artist's discography """
+    from deemon.cmd.refresh import Refresh
+    from dbgen import album_id
+    payloads = [{'artist_id': a, 'releases': [{'id': album_id(a, p)} for p in range(25)]}
+                for a in range(1, ctx['artists'] + 1)]
+    refresh = Refresh(skip_download=True, active_api=ctx['api'])
+    start = time.perf_counter()
+    seen = refresh.build_seen_index()
+    for payload in payloads:
+        refresh.remove_existing_releases(payload, seen)
+    return time.perf_counter() - start
+
+
+def bench_monitor(ctx):
+    """ Monitor as many artists as are in the database, half of them already monitored """
+    from deemon.cmd.monitor import Monitor
+    artists = ctx['artists']
+    api_result = [{'id': i, 'name': f"Artist {i:06d}"} for i in range(artists // 2 + 1, artists + artists // 2 + 1)]
+    monitor = Monitor(active_api=ctx['api'])
+    monitor.set_config(None, False, None, None)
+    start = time.perf_counter()
+    monitor.build_artist_query(api_result)
+    return time.perf_counter() - start
+
+
+def bench_import(ctx):
+    """
+    Import a file of as many artist IDs as are monitored, half of them new,
+    without the refresh that follows an import
+    """
+    from deemon.cmd.monitor import Monitor
+    artists = ctx['artists']
+    import_file = ctx['workdir'] / "import.csv"
+    import_file.write_text("\n".join(str(i) for i in range(artists // 2 + 1, artists + artists // 2 + 1)))
+    monitor = Monitor(active_api=ctx['api'])
+    monitor.set_config(None, False, None, None)
+    start = time.perf_counter()
+    with mock.patch.object(Monitor, 'call_refresh'):
+        monitor.importer(str(import_file))
+    return time.perf_counter() - start
+
+
+def create_library(ctx) -> Path:
+    """
+    Create a directory per artist for as many artists as are monitored, half
+    of them new. One in ten has an artist ID file and one in twenty names an
+    artist that can't be found.
+    """
+    from deemon.cmd.monitor import ARTIST_ID_FILE
+    artists = ctx['artists']
+    library = ctx['workdir'] / "library"
+    shutil.rmtree(library, ignore_errors=True)
+    for i in range(artists // 2 + 1, artists + artists // 2 + 1):
+        artist_dir = library / (f"Artist {i:06d}" if i % 20 else f"Unknown {i:06d}")
+        artist_dir.mkdir(parents=True)
+        if not i % 10:
+            (artist_dir / ARTIST_ID_FILE).write_text(str(i))
+    return library
+
+
+def bench_import_directory(ctx):
+    """ Import a directory of artist names, without the refresh that follows """
+    from deemon.cmd.monitor import Monitor
+    library = create_library(ctx)
+    monitor = Monitor(active_api=ctx['api'])
+    monitor.set_config(None, False, None, None)
+    start = time.perf_counter()
+    with mock.patch.object(Monitor, 'call_refresh'):
+        monitor.importer(str(library))
+    return time.perf_counter() - start
+
+
+def bench_reimport_directory(ctx):
+    """ Import a directory of artist names again after monitoring it """
+    from deemon.cmd.monitor import Monitor
+    library = create_library(ctx)
+    monitor = Monitor(active_api=ctx['api'])
+    monitor.set_config(None, False, None, None)
+    with mock.patch.object(Monitor, 'call_refresh'):
+        monitor.importer(str(library))
+        start = time.perf_counter()
+        monitor.importer(str(library))
+    return time.perf_counter() - start
+
+
+def bench_show_releases(ctx):
+    from deemon.cmd.show import Show
+    show = Show()
+    start = time.perf_counter()
+    show.releases(30, False)
+    return time.perf_counter() - start
+
+
+def bench_show_future_releases(ctx):
+    from deemon.cmd.show import Show
+    show = Show()
+    start = time.perf_counter()
+    show.releases(0, True)
+    return time.perf_counter() - start
+
+
+def bench_rollback_view(ctx):
+    """ List transactions and exit at the prompt without rolling back """
+    from deemon.cmd import rollback
+    start = time.perf_counter()
+    with mock.patch('builtins.input', return_value=""):
+        rollback.view_transactions()
+    return time.perf_counter() - start
+
+
+BENCHMARKS = {
+    'refresh': bench_refresh,
+    'seen_diff': bench_seen_diff,
+    'monitor': bench_monitor,
+    'import': bench_import,
+    'import_directory': bench_import_directory,
+    'reimport_directory': bench_reimport_directory,
+    'show_releases': bench_show_releases,
+    'show_future_releases': bench_show_future_releases,
+    'rollback_view': bench_rollback_view,
+}
+
+# query_plans checks the database used by BENCHMARKS rather than timing anything
+ALL_BENCHMARKS = list(BENCHMARKS) + ['query_plans'] + list(micro.MICRO_BENCHMARKS)
+
+
+def int_list(value: str) -> list:
+    return [int(x) for x in value.split(",") if x]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run deemon benchmarks offline")
+    parser.add_argument('--artists', type=int_list, default=[1000, 10000, 50000], metavar="N[,N...]",
+                        help="Database sizes to benchmark, in monitored artists (default: 1000,10000,50000)")
+    parser.add_argument('--releases', type=int, default=1000000, metavar="N",
+                        help="Releases stored in each database (default: 1000000)")
+    parser.add_argument('--only', type=lambda x: x.split(","), default=ALL_BENCHMARKS, metavar="NAME[,NAME...]",
+                        help=f"Benchmarks to run: {', '.join(ALL_BENCHMARKS)}")
+    parser.add_argument('--repeat', type=int, default=3, metavar="N",
+                        help="Number of times each benchmark is run (default: 3)")
+    parser.add_argument('--fixtures', type=Path, default=DEFAULT_FIXTURES, metavar="FILE",
+                        help="Recorded discographies to replay")
+    parser.add_argument('--backend', choices=("threaded", "async"), default="threaded",
+                        help="API backend replayed responses are fetched through (default: threaded)")
+    parser.add_argument('--latency', type=float, default=0, metavar="MS",
+                        help="Simulated latency of each API call in milliseconds (default: 0)")
+    parser.add_argument('--seed', type=int, default=1, help="Seed used to generate databases")
+    parser.add_argument('-o', '--output', type=Path, metavar="FILE", help="Write results to FILE instead of stdout")
+    args = parser.parse_args(argv)
+    unknown = [x for x in args.only if x not in ALL_BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = Path(tempfile.mkdtemp(prefix="deemon-bench-"))
+    os.environ['XDG_CONFIG_HOME'] = str(workdir / "config")
+
+    try:
+        results = run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+    if results['failures']:
+        sys.exit(1)
+
+
+def run(args, workdir: Path) -> dict:
+    # deemon reads XDG_CONFIG_HOME when first imported
+    import deemon
+    from deemon.core import db
+    from deemon.core.config import Config
+
+    import dbgen
+    import plans
+    import replay
+
+    config = Config()
+    Config._CONFIG['deemix']['check_account_status'] = False
+    fixtures = replay.load_fixtures(args.fixtures)
+    # The async backend makes HTTP requests, so it is served by a local server
+    server = replay.ReplayServer(fixtures, args.latency / 1000)
+    if args.backend == "async":
+        active_api = replay.AsyncReplayAPI(fixtures, server, args.latency / 1000)
+    else:
+        active_api = replay.ReplayAPI(fixtures, args.latency / 1000)
+
+    def save(snapshot: Path):
+        with contextlib.closing(sqlite3.connect(snapshot)) as dest:
+            db.Database().conn.backup(dest)
+
+    def restore(snapshot: Path):
+        # Copy pages through SQLite so connections held by other threads stay valid
+        with contextlib.closing(sqlite3.connect(snapshot)) as src:
+            database = db.Database()
+            database.commit()
+            src.backup(database.conn)
+        config.set('tid', db.Database().get_next_transaction_id(), validate=False)
+        config.set('start_time', int(time.time()), validate=False)
+
+    empty = workdir / "deemon-empty.db"
+    save(empty)
+
+    results = []
+    failures = []
+
+    def measure(name: str, benchmark, ctx: dict, snapshot: Path, details: dict):
+        runs = []
+        extra = {}
+        for _ in range(args.repeat):
+            restore(snapshot)
+            with quiet():
+                result = benchmark(ctx)
+            if isinstance(result, tuple):
+                result, extra = result
+            runs.append(result)
+        failures.extend(extra.pop('failures', []))
+        print(f"   {name}: {min(runs):.3f}s", file=sys.stderr)
+        results.append({
+            'benchmark': name,
+            **details,
+            **extra,
+            'runs': [round(x, 6) for x in runs],
+            'min': round(min(runs), 6),
+            'median': round(statistics.median(runs), 6),
+        })
+
+    ctx = {'api': active_api, 'workdir': workdir, 'repo': BENCHMARK_DIR.parent, 'seed': args.seed,
+           'fixtures': fixtures, 'server': server}
+    query_plans = []
+    dataset_names = [x for x in args.only if x in BENCHMARKS or x == 'query_plans']
+    for artists in args.artists if dataset_names else []:
+        print(f":: Generating database with {artists:,} artists and {args.releases:,} releases...",
+              file=sys.stderr)
+        restore(empty)
+        dataset = dbgen.generate(artists, args.releases, args.seed)
+        snapshot = workdir / f"deemon-{artists}.db"
+        save(snapshot)
+
+        ctx['artists'] = artists
+        for name in dataset_names:
+            if name == 'query_plans':
+                restore(snapshot)
+                checked = plans.check(artists)
+                for x in checked:
+                    if x['full_scans']:
+                        failures.append(f"{x['method']} scans {', '.join(x['full_scans'])}: {x['query']}")
+                query_plans.append({**dataset, 'queries': checked})
+                print(f"   query_plans: {sum(1 for x in checked if x['full_scans'])} full scan(s)", file=sys.stderr)
+                continue
+            measure(name, BENCHMARKS[name], ctx, snapshot, dataset)
+        snapshot.unlink()
+
+    micro_names = [x for x in args.only if x in micro.MICRO_BENCHMARKS]
+    if micro_names:
+        print(":: Running benchmarks independent of database size...", file=sys.stderr)
+    for name in micro_names:
+        measure(name, micro.MICRO_BENCHMARKS[name], ctx, empty, {})
+
+    server.close()
+    for failure in failures:
+        print(f"   [!] {failure}", file=sys.stderr)
+
+    return {
+        'deemon_version': deemon.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': int(time.time()),
+        'settings': {'releases': args.releases, 'repeat': args.repeat, 'backend': args.backend,
+                     'latency_ms': args.latency, 'seed': args.seed, 'fixtures': args.fixtures.name},
+        'results': results,
+        'query_plans': query_plans,
+        'failures': failures,
+    }
+
+
+if __name__ == "__main__":
+    main()
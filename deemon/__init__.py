@@ -2,7 +2,7 @@
 from deemon.utils import startup
 
 __version__ = '2.22'
-__dbversion__ = '3.7'
+__dbversion__ = '3.13'
 
 appdata = startup.get_appdata_dir()
 startup.init_appdata_dir(appdata)
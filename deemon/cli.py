@@ -1,6 +1,8 @@
+import atexit
 import logging
 import platform
 import sys
+import threading
 import time
 from pathlib import Path
 
@@ -8,18 +10,13 @@ import click
 from packaging.version import parse as parse_version
 
 from deemon import __version__
-from deemon.cmd import download, rollback, backup, extra, tests, upgradelib
-from deemon.cmd.artistconfig import artist_lookup
-from deemon.cmd.monitor import Monitor
-from deemon.cmd.profile import ProfileConfig
-from deemon.cmd.refresh import Refresh
-from deemon.cmd.search import Search
-from deemon.cmd.show import Show
-from deemon.core import notifier
 from deemon.core.config import Config, LoadProfile
 from deemon.core.db import Database
 from deemon.core.logger import setup_logger
-from deemon.utils import startup, dataprocessor, validate
+from deemon.utils import startup, dataprocessor, validate, performance
+
+# Command modules (and their deemix, plexapi and mutagen dependencies) are
+# imported inside each command so startup only pays for the command being run
 
 logger = None
 config = None
@@ -27,6 +24,18 @@ db = None
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
+
+def check_for_updates(release_channel: str):
+    """
+    Fetch latest version in the background and store it for the next run
+    """
+    latest_ver = startup.get_latest_version(release_channel)
+    update_db = Database()
+    if latest_ver:
+        update_db.set_latest_version(str(latest_ver))
+    update_db.set_last_update_check()
+
+
 @click.group(context_settings=CONTEXT_SETTINGS, invoke_without_command=True,
              no_args_is_help=True)
 @click.option('--whats-new', is_flag=True, help="Show release notes from this version")
@@ -36,7 +45,9 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 @click.option('-P', '--profile', help="Specify profile to run deemon as")
 @click.version_option(__version__, '-V', '--version', message='deemon %(version)s')
 @click.option('-v', '--verbose', is_flag=True, help="Show debug output")
-def run(whats_new, init, arl, verbose, profile):
+@click.option('--profile-run', metavar='FILE', type=Path, help="Save timing of this run as a Chrome trace")
+@click.option('--cprofile', is_flag=True, help="Also save cProfile data next to the --profile-run file")
+def run(whats_new, init, arl, verbose, profile, profile_run, cprofile):
     """Monitoring and alerting tool for new music releases using the Deezer API.
 
     deemon is a free and open source tool. To report issues or to contribute,
@@ -57,6 +68,13 @@ def run(whats_new, init, arl, verbose, profile):
     if whats_new:
         return startup.get_changelog(__version__)
 
+    if profile_run:
+        performance.start_profiling(cprofile)
+        atexit.register(performance.write_profile, profile_run,
+                        profile_run.with_suffix(".prof") if cprofile else None)
+    elif cprofile:
+        logger.warning("--cprofile requires --profile-run")
+
     if init:
         app_data_path = startup.get_appdata_dir()
         startup.reinit_appdata_dir(app_data_path)
@@ -96,15 +114,17 @@ def run(whats_new, init, arl, verbose, profile):
             logger.debug(f"Release channel changed to '{config.release_channel()}'")
             db.set_release_channel()
             last_checked = 0
-        if time.time() >= next_check or last_checked == 0:
-            logger.info(f"Checking for updates ({config.release_channel()})...")
-            config.set('update_available', 0, False)
-            latest_ver = str(startup.get_latest_version(config.release_channel()))
-            if latest_ver:
-                db.set_latest_version(latest_ver)
-            db.set_last_update_check()
+        if (time.time() >= next_check or last_checked == 0) and sys.stdin.isatty() and sys.stdout.isatty():
+            # Only check from an interactive terminal; cron runs use the last known version
+            logger.debug(f"Checking for updates ({config.release_channel()})...")
+            update_check = threading.Thread(target=check_for_updates, args=(config.release_channel(),),
+                                            daemon=True)
+            update_check.start()
+            # Give a slow check a chance to finish before exit so the result is saved
+            atexit.register(update_check.join, startup.UPDATE_CHECK_TIMEOUT)
+        config.set('update_available', 0, False)
         new_version = db.get_latest_ver()
-        if parse_version(new_version) > parse_version(__version__):
+        if new_version and parse_version(new_version) > parse_version(__version__):
             if parse_version(new_version).major > parse_version(__version__).major:
                 config.set('update_available', new_version, False)
                 print("*" * 80)
@@ -131,6 +151,9 @@ def run(whats_new, init, arl, verbose, profile):
 @click.option('-E', '--exclusions', metavar="URL", type=str, help="Test exclude regex pattern against URL")
 def test(email, exclusions):
     """Run tests on email configuration, exclusion filters, etc."""
+    from deemon.cmd import tests
+    from deemon.core import notifier
+
     if email:
         notification = notifier.Notify()
         notification.test()
@@ -168,6 +191,7 @@ def download_command(artist, artist_id, album_id, url, file, bitrate,
         download Mozart
         download -i 100 -t album -b 9
     """
+    from deemon.cmd import download
 
     if bitrate:
         config.set('bitrate', bitrate)
@@ -224,6 +248,8 @@ def monitor_command(artist, im, playlist, include_artists, bitrate, record_type,
         monitor --artist-id 100
         monitor --url https://www.deezer.com/us/artist/000
     """
+    from deemon.cmd.monitor import Monitor
+
     monitor = Monitor()
     if download_path:
         if not Path(download_path).exists():
@@ -282,8 +308,12 @@ def monitor_command(artist, im, playlist, include_artists, bitrate, record_type,
 @click.option('-p', '--playlist', is_flag=True, help="Refresh a specific playlist by name")
 @click.option('-s', '--skip-download', is_flag=True, help="Skips downloading of new releases")
 @click.option('-T', '--time-machine', metavar='DATE', type=str, help='Refresh as if it were this date (YYYY-MM-DD)')
-def refresh_command(name, playlist, skip_download, time_machine):
+@click.option('--no-cache', is_flag=True, help="Ignore cached API responses and fetch everything")
+@click.option('--full', is_flag=True, help="Refresh all artists, ignoring the refresh schedule")
+@click.option('--resume', is_flag=True, help="Resume an interrupted refresh")
+def refresh_command(name, playlist, skip_download, time_machine, no_cache, full, resume):
     """Check artists for new releases"""
+    from deemon.cmd.refresh import Refresh
 
     if time_machine:
         time_machine = validate.validate_date(time_machine)
@@ -291,7 +321,7 @@ def refresh_command(name, playlist, skip_download, time_machine):
             return logger.error("Date for time machine is invalid")
 
     logger.info(":: Starting database refresh")
-    refresh = Refresh(time_machine, skip_download)
+    refresh = Refresh(time_machine, skip_download, no_cache=no_cache, full_refresh=full, resume=resume)
     if playlist:
         if not len(name):
             return logger.warning("You must provide the name of a playlist")
@@ -321,6 +351,8 @@ def show_artists(artist, csv, export, filter, hide_header, backup):
     if artist:
         artist = ' '.join([x for x in artist])
 
+    from deemon.cmd.show import Show
+
     show = Show()
     show.monitoring(artist=True, query=artist, export_csv=csv, save_path=export, filter=filter, hide_header=hide_header,
                     backup=backup)
@@ -337,6 +369,8 @@ def show_artists(title, playlist_id, csv, filter, hide_header):
     if title:
         title = ' '.join([x for x in title])
 
+    from deemon.cmd.show import Show
+
     show = Show()
     show.monitoring(artist=False, query=title, export_csv=csv, filter=filter, hide_header=hide_header, is_id=playlist_id)
 
@@ -348,6 +382,8 @@ def show_releases(n, future):
     """
     Show list of new or future releases
     """
+    from deemon.cmd.show import Show
+
     show = Show()
     show.releases(n, future)
 
@@ -360,6 +396,7 @@ run.add_command(show_command)
 @click.option('-r', '--restore', is_flag=True, help='Restore from existing backup')
 def backup_command(restore, include_logs):
     """Backup configuration and database to a tar file"""
+    from deemon.cmd import backup
 
     if restore:
         backup.restore()
@@ -441,6 +478,7 @@ def reset_db():
 @click.option('-e', '--edit', is_flag=True, help="Edit an existing profile")
 def profile_command(profile, add, clear, delete, edit):
     """Add, modify and delete configuration profiles"""
+    from deemon.cmd.profile import ProfileConfig
 
     pc = ProfileConfig(profile)
     if profile:
@@ -461,6 +499,8 @@ def profile_command(profile, add, clear, delete, edit):
 @run.command(name="extra")
 def extra_command():
     """Fetch extra release info"""
+    from deemon.cmd import extra
+
     extra.main()
 
 
@@ -468,6 +508,8 @@ def extra_command():
 @click.argument('query', nargs=-1, required=False)
 def search(query):
     """Interactively search and download/monitor artists"""
+    from deemon.cmd.search import Search
+
     if query:
         query = ' '.join(query)
 
@@ -479,6 +521,8 @@ def search(query):
 @click.argument('artist', nargs=-1, required=True)
 def config_command(artist):
     """Configure per-artist settings by name or ID"""
+    from deemon.cmd.artistconfig import artist_lookup
+
     artist = ' '.join([x for x in artist])
     artist_lookup(artist)
 
@@ -488,6 +532,8 @@ def config_command(artist):
 @click.option('-v', '--view', is_flag=True, help="View recent refresh transactions")
 def rollback_command(num, view):
     """Rollback a previous monitor or refresh transaction"""
+    from deemon.cmd import rollback
+
     if view:
         rollback.view_transactions()
     elif num:
@@ -506,11 +552,14 @@ def library_command():
 @click.option('-A', '--album-only', is_flag=True, help="Get album IDs instead of track IDs (Fastest)")
 @click.option('-E', '--allow-exclusions', is_flag=True, help="Allow exclusions to be applied")
 @click.option('-O', '--output', metavar='PATH', help="Output file to save IDs (default: current directory)")
-def library_upgrade_command(library, output, album_only, allow_exclusions):
-    """ (BETA) Scans MP3 files in PATH and generates a text file containing album/track IDs """
+@click.option('-p', '--processes', is_flag=True, help="Read tags using a process per CPU core")
+def library_upgrade_command(library, output, album_only, allow_exclusions, processes):
+    """ (BETA) Scans MP3, FLAC and M4A files in PATH and generates a text file containing album/track IDs """
+    from deemon.cmd import upgradelib
+
     if not output:
         output = Path.cwd()
-    upgradelib.upgrade(library, output, album_only, allow_exclusions)
+    upgradelib.upgrade(library, output, album_only, allow_exclusions, processes)
 
 
 run.add_command(library_command)
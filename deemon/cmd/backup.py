@@ -8,6 +8,7 @@ from packaging.version import parse as parse_version
 from tqdm import tqdm
 
 from deemon import __version__
+from deemon.core.db import Database, close_connections
 from deemon.utils import startup, dates
 
 logger = logging.getLogger(__name__)
@@ -25,6 +26,9 @@ def run(include_logs: bool = False):
     backup_tar = dates.generate_date_filename("backup-" + __version__ + "-") + ".tar"
     backup_path = startup.get_backup_dir()
 
+    # Make sure deemon.db contains everything still held in the WAL
+    Database().checkpoint()
+
     with tarfile.open(backup_path / backup_tar, "w") as tar:
         tar.add(startup.get_appdata_dir(), arcname='deemon', filter=filter_func)
         logger.info(f"Backed up to {backup_path / backup_tar}")
@@ -76,6 +80,12 @@ def restore():
     def restore_tarfile(archive: dict):
         logger.debug("Restoring backup from `" + str(archive['filename'].name + "`"))
         extract_dir = startup.get_appdata_dir()
+        # Empty the WAL and close the shared connection so neither the WAL nor
+        # the open connection's pages end up on top of the restored database
+        Database().checkpoint()
+        close_connections()
+        for suffix in ("-wal", "-shm"):
+            Path(f"{startup.get_database()}{suffix}").unlink(missing_ok=True)
         tar = tarfile.open(archive['filename'])
         progress = tqdm(tar.getmembers(), ascii=" #",
                         bar_format='{desc}  [{bar}] {percentage:3.0f}%')
@@ -89,6 +99,8 @@ def restore():
                     logger.debug(f"Restored {member.name} to {extract_dir}")
             if member == tar.getmembers()[-1]:
                 progress.set_description_str("Restore complete")
+        # Anything that opened the database during the restore reopens it
+        close_connections()
 
     def is_newer_backup(version: str):
         if parse_version(version) > parse_version(__version__):
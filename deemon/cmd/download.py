@@ -1,6 +1,8 @@
 import logging
 import os
+import queue
 import sys
+import threading
 
 import requests
 from concurrent.futures import ThreadPoolExecutor
@@ -14,9 +16,9 @@ import plexapi.exceptions
 from plexapi.server import PlexServer
 
 from deemon import utils
-from deemon.core import dmi, db, api, common
+from deemon.core import dmi, db, api, common, session
 from deemon.core.config import Config as config
-from deemon.utils import ui, dataprocessor, startup, dates
+from deemon.utils import ui, dataprocessor, startup, dates, performance, metrics
 
 logger = logging.getLogger(__name__)
 
@@ -119,10 +121,10 @@ def refresh_plex(plexobj):
 
 class Download:
 
-    def __init__(self, active_api=None):
+    def __init__(self, active_api=None, write_metrics: bool = True):
         super().__init__()
-        self.api = active_api or api.PlatformAPI()
-        self.dz = deezer.Deezer()
+        self.api = active_api or api.get_platform_api()
+        self.dz = session.get_session()
         self.di = dmi.DeemixInterface()
         self.queue_list = []
         self.db = db.Database()
@@ -131,6 +133,15 @@ class Download:
         self.release_to = None
         self.verbose = os.environ.get("VERBOSE")
         self.duplicate_id_count = 0
+        self.worker_state = threading.local()
+        self.plex = None
+        self.stream_queue = None
+        self.stream_thread = None
+        self.stream_failed = []
+        # Refresh writes its own metrics once downloads have finished
+        self.write_metrics = write_metrics
+        # Set by a checkpointed refresh to record releases as they finish downloading
+        self.refresh_run_id = None
 
     def set_dates(self, from_date: str = None, to_date: str = None) -> None:
         """Set to/from dates to get while downloading"""
@@ -159,94 +170,227 @@ class Download:
             print("")
             logger.info(":: Sending " + str(len(self.queue_list)) + " release(s) to deemix for download:")
 
-            with open(startup.get_appdata_dir() / "queue.csv", "w", encoding="utf-8") as f:
-                f.writelines(','.join([str(x) for x in vars(self.queue_list[0]).keys()]) + "\n")
-                logger.debug(f"Writing queue to CSV file - {len(self.queue_list)} items in queue")
-                for q in self.queue_list:
-                    raw_values = [str(x) for x in vars(q).values()]
-                    # TODO move this to shared function
-                    for i, v in enumerate(raw_values):
-                        if '"' in v:
-                            raw_values[i] = v.replace('"', "'")
-                        if ',' in v:
-                            raw_values[i] = f'"{v}"'
-                    f.writelines(','.join(raw_values) + "\n")
-            logger.debug(f"Queue exported to {startup.get_appdata_dir()}/queue.csv")
-
-            failed_count = []
-            download_progress = tqdm(
-                self.queue_list,
-                total=len(self.queue_list),
-                desc="Downloading releases...",
-                ascii=" #",
-                bar_format=ui.TQDM_FORMAT
-            )
-            for index, item in enumerate(download_progress):
-                i = str(index + 1)
-                t = str(len(download_progress))
-                download_progress.set_description_str(f"Downloading release {i} of {t}...")
-                dx_bitrate = get_deemix_bitrate(item.bitrate)
-                if self.verbose == "true":
-                    logger.debug(f"Processing queue item {vars(item)}")
-                try:
-                    if item.download_path:
-                        download_path = item.download_path
-                    else:
-                        download_path = None
-
-                    if item.artist_name:
-                        if item.album_title:
-                            logger.info(f"   > {item.artist_name} - {item.album_title}... ")
-                            self.di.download_url([item.url], dx_bitrate, download_path)
-                        else:
-                            logger.info(f"   > {item.artist_name} - {item.track_title}... ")
-                            self.di.download_url([item.url], dx_bitrate, download_path)
-                    else:
-                        logger.info(f"   > {item.playlist_title} (playlist)...")
-                        self.di.download_url([item.url], dx_bitrate, download_path, override_deemix=True)
-                except (deemix.errors.GenerationError, errors.WrongGeolocation) as e:
-                    logger.debug(e)
-                    failed_count.append([(item, "No tracks listed or unavailable in your country")])
-                except Exception as e:
-                    if item.artist_name and item.album_title:
-                        logger.info(f"The following error occured while downloading {item.artist_name} - {item.album_title}: {e}")
-                    elif item.artist_name and item.track_title:
-                        logger.info(f"The following error occured while downloading {item.artist_name} - {item.track_title}: {e}")
-                    else:
-                        logger.info(f"The following error occured while downloading {item.playlist_title}: {e}")
-                    pass
-
-
-            failed_count = [x for x in failed_count if x]
+            self.write_queue_csv()
+            performance.increment("download.queued", len(self.queue_list))
 
-            print("")
-            if len(failed_count):
-                logger.info(f"   [!] Downloads completed with {len(failed_count)} error(s):")
-                with open(startup.get_appdata_dir() / "failed.csv", "w", encoding="utf-8") as f:
-                    f.writelines(','.join([str(x) for x in vars(self.queue_list[0]).keys()]) + "\n")
-                    for failed in failed_count:
-                        try:
-                            raw_values = [str(x) for x in vars(failed[0]).values()]
-                        except TypeError as e:
-                            print(f"Error reading from failed.csv. Entry that failed was either invalid or empty: {failed}")
-                            logger.error(e)
-                        else:
-                            # TODO move this to shared function
-                            for i, v in enumerate(raw_values):
-                                if '"' in v:
-                                    raw_values[i] = v.replace('"', "'")
-                                if ',' in v:
-                                    raw_values[i] = f'"{v}"'
-                            f.writelines(','.join(raw_values) + "\n")
-                            print(f"+ {failed[0].artist_name} - {failed[0].album_title} --- Reason: {failed[1]}")
-                print("")
-                logger.info(f":: Failed downloads exported to: {startup.get_appdata_dir()}/failed.csv")
+            workers = self.get_worker_count()
+            if workers > 1:
+                failed_count = self.download_concurrent(workers)
             else:
-                logger.info("   Downloads complete!")
+                failed_count = []
+                download_progress = tqdm(
+                    self.queue_list,
+                    total=len(self.queue_list),
+                    desc="Downloading releases...",
+                    ascii=" #",
+                    bar_format=ui.TQDM_FORMAT
+                )
+                for index, item in enumerate(download_progress):
+                    i = str(index + 1)
+                    t = str(len(download_progress))
+                    download_progress.set_description_str(f"Downloading release {i} of {t}...")
+                    failed_count.append(self.download_item(self.di, item))
+
+            self.report_failures(failed_count)
             if plex and (config.plex_library() != ""):
                 refresh_plex(plex)
+        if self.write_metrics:
+            metrics.write("download")
         return True
 
+    def write_queue_csv(self):
+        with open(startup.get_appdata_dir() / "queue.csv", "w", encoding="utf-8") as f:
+            f.writelines(','.join([str(x) for x in vars(self.queue_list[0]).keys()]) + "\n")
+            logger.debug(f"Writing queue to CSV file - {len(self.queue_list)} items in queue")
+            for q in self.queue_list:
+                raw_values = [str(x) for x in vars(q).values()]
+                # TODO move this to shared function
+                for i, v in enumerate(raw_values):
+                    if '"' in v:
+                        raw_values[i] = v.replace('"', "'")
+                    if ',' in v:
+                        raw_values[i] = f'"{v}"'
+                f.writelines(','.join(raw_values) + "\n")
+        logger.debug(f"Queue exported to {startup.get_appdata_dir()}/queue.csv")
+
+    def report_failures(self, failed_count: list):
+        failed_count = [x for x in failed_count if x]
+        performance.increment("download.failed", len(failed_count))
+
+        print("")
+        if len(failed_count):
+            logger.info(f"   [!] Downloads completed with {len(failed_count)} error(s):")
+            with open(startup.get_appdata_dir() / "failed.csv", "w", encoding="utf-8") as f:
+                f.writelines(','.join([str(x) for x in vars(self.queue_list[0]).keys()]) + "\n")
+                for failed in failed_count:
+                    try:
+                        raw_values = [str(x) for x in vars(failed[0]).values()]
+                    except TypeError as e:
+                        print(f"Error reading from failed.csv. Entry that failed was either invalid or empty: {failed}")
+                        logger.error(e)
+                    else:
+                        # TODO move this to shared function
+                        for i, v in enumerate(raw_values):
+                            if '"' in v:
+                                raw_values[i] = v.replace('"', "'")
+                            if ',' in v:
+                                raw_values[i] = f'"{v}"'
+                        f.writelines(','.join(raw_values) + "\n")
+                        print(f"+ {failed[0].artist_name} - {failed[0].album_title} --- Reason: {failed[1]}")
+            print("")
+            logger.info(f":: Failed downloads exported to: {startup.get_appdata_dir()}/failed.csv")
+        else:
+            logger.info("   Downloads complete!")
+
+    @staticmethod
+    def get_worker_count() -> int:
+        workers = config.download_threads()
+        if workers > 1 and config.halt_download_on_error():
+            logger.debug("halt_download_on_error is enabled, downloading releases one at a time")
+            workers = 1
+        return workers
+
+    def start_stream(self) -> bool:
+        """
+        Start downloading releases in the background as they are added with
+        stream(). Call finish_stream() once everything has been queued.
+        """
+        if not self.di.login():
+            logger.error("Failed to login, aborting download...")
+            return False
+        self.plex = get_plex_server()
+        self.stream_queue = queue.Queue()
+        self.stream_thread = threading.Thread(target=self.consume_stream, args=(self.get_worker_count(),),
+                                              daemon=True)
+        self.stream_thread.start()
+        return True
+
+    def stream(self, item: QueueItem):
+        """ Add an item to the queue; releases start downloading right away """
+        self.queue_list.append(item)
+        if item.artist_name:
+            self.stream_queue.put(item)
+
+    def consume_stream(self, workers: int):
+        if workers > 1:
+            def worker(item):
+                return self.download_item(self.get_worker_interface(), item)
+
+            with ThreadPoolExecutor(max_workers=workers) as ex:
+                futures = []
+                while (item := self.stream_queue.get()) is not None:
+                    futures.append(ex.submit(worker, item))
+                self.stream_failed.extend(f.result() for f in futures)
+        else:
+            while (item := self.stream_queue.get()) is not None:
+                self.stream_failed.append(self.download_item(self.di, item))
+
+    def finish_stream(self):
+        """
+        Wait for streamed downloads to complete, then download playlists and
+        report failures
+        """
+        self.stream_queue.put(None)
+        self.stream_thread.join()
+
+        if not self.queue_list:
+            return
+        for item in [q for q in self.queue_list if not q.artist_name]:
+            self.stream_failed.append(self.download_item(self.di, item))
+
+        self.write_queue_csv()
+        performance.increment("download.queued", len(self.queue_list))
+        self.report_failures(self.stream_failed)
+        if self.plex and (config.plex_library() != ""):
+            refresh_plex(self.plex)
+
+    @performance.span("download.item", category="download")
+    def download_item(self, di, item):
+        """
+        Send a single queue item to deemix using the provided DeemixInterface.
+        Returns a tuple of (item, reason) if the item failed to download.
+        """
+        dx_bitrate = get_deemix_bitrate(item.bitrate)
+        if self.verbose == "true":
+            logger.debug(f"Processing queue item {vars(item)}")
+        try:
+            if item.download_path:
+                download_path = item.download_path
+            else:
+                download_path = None
+
+            # Only playlists need deemix's playlist generation patched; leave the
+            # process-wide function alone while workers download releases
+            if item.artist_name:
+                if item.album_title:
+                    logger.info(f"   > {item.artist_name} - {item.album_title}... ")
+                    di.download_url([item.url], dx_bitrate, download_path, override_deemix=False)
+                else:
+                    logger.info(f"   > {item.artist_name} - {item.track_title}... ")
+                    di.download_url([item.url], dx_bitrate, download_path, override_deemix=False)
+            else:
+                logger.info(f"   > {item.playlist_title} (playlist)...")
+                di.download_url([item.url], dx_bitrate, download_path, override_deemix=True)
+        except (deemix.errors.GenerationError, errors.WrongGeolocation) as e:
+            logger.debug(e)
+            return item, "No tracks listed or unavailable in your country"
+        except Exception as e:
+            # Not listed in failed.csv, so count it here rather than in report_failures()
+            performance.increment("download.failed")
+            if item.artist_name and item.album_title:
+                logger.info(f"The following error occured while downloading {item.artist_name} - {item.album_title}: {e}")
+            elif item.artist_name and item.track_title:
+                logger.info(f"The following error occured while downloading {item.artist_name} - {item.track_title}: {e}")
+            else:
+                logger.info(f"The following error occured while downloading {item.playlist_title}: {e}")
+        else:
+            performance.increment("download.downloaded")
+            if self.refresh_run_id and item.album_id:
+                self.db.add_refresh_run_release(self.refresh_run_id, item.album_id)
+
+    def get_worker_interface(self):
+        """ Return a DeemixInterface owned by the calling worker thread """
+        if not hasattr(self.worker_state, 'di'):
+            worker_di = dmi.DeemixInterface()
+            worker_di.login_with_verified_arl(self.di.arl)
+            self.worker_state.di = worker_di
+        return self.worker_state.di
+
+    def download_concurrent(self, workers: int) -> list:
+        """
+        Download releases using a pool of workers, each with its own deemix
+        session and settings. Playlists rely on a patched deemix function bound
+        to a single DeemixInterface so they are downloaded afterwards, in order.
+        """
+        releases = [q for q in self.queue_list if q.artist_name]
+        playlists = [q for q in self.queue_list if not q.artist_name]
+        failed_count = []
+        lock = threading.Lock()
+
+        logger.debug(f"Downloading {len(releases)} release(s) using {workers} workers")
+        download_progress = tqdm(
+            total=len(self.queue_list),
+            desc=f"Downloading {len(self.queue_list)} release(s)...",
+            ascii=" #",
+            bar_format=ui.TQDM_FORMAT
+        )
+
+        def worker(item):
+            result = self.download_item(self.get_worker_interface(), item)
+            with lock:
+                failed_count.append(result)
+                download_progress.update(1)
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(worker, releases))
+
+        for item in playlists:
+            failed_count.append(self.download_item(self.di, item))
+            download_progress.update(1)
+
+        download_progress.close()
+        return failed_count
+
     def download(self, artist, artist_id, album_id, url,
                  artist_file, track_file, album_file, track_id, auto=True, monitored=False):
 
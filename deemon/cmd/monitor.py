@@ -1,18 +1,24 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import time
 from pathlib import Path
 
 from tqdm import tqdm
 
 from deemon.cmd import search
 from deemon.cmd.refresh import Refresh
-from deemon.core.api import PlatformAPI
+from deemon.core.api import get_platform_api
 from deemon.core.config import Config as config
 from deemon.core.db import Database
 from deemon.utils import dataprocessor, ui
 
 logger = logging.getLogger(__name__)
 
+# Seconds before an imported name that matched no artist is searched for again
+NO_MATCH_TTL = 604800
+
+# File in an artist's directory containing its Deezer artist ID
+ARTIST_ID_FILE = ".deemon"
+
 
 class Monitor:
 
@@ -28,7 +34,7 @@ class Monitor:
         self.time_machine = None
         self.dl = None
         self.db = Database()
-        self.api = active_api or PlatformAPI()
+        self.api = active_api or get_platform_api()
 
     def set_config(self, bitrate: str, alerts: bool, record_type: str, download_path: Path):
         self.bitrate = bitrate
@@ -102,7 +108,9 @@ class Monitor:
 
     # @performance.timeit
     def build_artist_query(self, api_result: list):
-        existing = self.db.get_all_monitored_artist_ids()
+        existing = set(self.db.get_all_monitored_artist_ids())
+        queued = set()
+        duplicates = 0
         artists_to_add = []
         pbar = tqdm(api_result, total=len(api_result), desc="Setting up artists for monitoring...", ascii=" #",
                     bar_format=ui.TQDM_FORMAT)
@@ -111,16 +119,22 @@ class Monitor:
                 continue
             if artist['id'] in existing:
                 logger.info(f"   - Already monitoring {artist['name']}, skipping...")
+            elif artist['id'] in queued:
+                logger.debug(f"Artist {artist['name']} ({artist['id']}) was found more than once, skipping...")
+                duplicates += 1
             else:
                 artist.update({'bitrate': self.bitrate, 'alerts': self.alerts, 'record_type': self.record_type,
                                'download_path': self.download_path, 'profile_id': config.profile_id(),
                                'trans_id': config.transaction_id()})
                 artists_to_add.append(artist)
+                queued.add(artist['id'])
+        if duplicates:
+            logger.info(f"   - Skipped {duplicates:,} duplicate artist(s)")
         if len(artists_to_add):
             logger.debug("New artists have been monitored. Saving changes to the database...")
-            self.db.new_transaction()
-            self.db.fast_monitor(artists_to_add)
-            self.db.commit()
+            with self.db.transaction():
+                self.db.new_transaction()
+                self.db.fast_monitor(artists_to_add)
             return True
 
     def build_playlist_query(self, api_result: list, include_artists: bool):
@@ -128,7 +142,8 @@ class Monitor:
         if include_artists:
             include_artists = '1'
 
-        existing = self.db.get_all_monitored_playlist_ids() or []
+        existing = set(self.db.get_all_monitored_playlist_ids())
+        queued = set()
         playlists_to_add = []
         pbar = tqdm(api_result, total=len(api_result), desc="Setting up playlists for monitoring...", ascii=" #",
                     bar_format=ui.TQDM_FORMAT)
@@ -137,6 +152,8 @@ class Monitor:
                 continue
             if playlist['id'] in existing:
                 logger.info(f"   Already monitoring {playlist['title']}, skipping...")
+            elif playlist['id'] in queued:
+                logger.debug(f"Playlist {playlist['title']} ({playlist['id']}) was found more than once, skipping...")
             else:
                 playlist.update(
                     {
@@ -149,11 +166,12 @@ class Monitor:
                     }
                 )
                 playlists_to_add.append(playlist)
+                queued.add(playlist['id'])
         if len(playlists_to_add):
             logger.debug("New playlists have been monitored. Saving changes to the database...")
-            self.db.new_transaction()
-            self.db.fast_monitor_playlist(playlists_to_add)
-            self.db.commit()
+            with self.db.transaction():
+                self.db.new_transaction()
+                self.db.fast_monitor_playlist(playlists_to_add)
             return True
 
     def call_refresh(self):
@@ -161,46 +179,96 @@ class Monitor:
         refresh.run()
 
     # @performance.timeit
-    def artists(self, names: list) -> None:
+    def artists(self, names: list, known: list = None, cached: bool = False) -> None:
         """
         Return list of dictionaries containing each artist
         """
         if self.remove:
             return self.purge_artists(names=names)
-        self.debugger("SpawningThreads", self.api.max_threads)
-        with ThreadPoolExecutor(max_workers=self.api.max_threads) as ex:
-            api_result = list(
-                tqdm(ex.map(self.api.search_artist, names), total=len(names),
-                     desc=f"Fetching artist data for {len(names):,} artist(s), please wait...",
-                     ascii=" #", bar_format=ui.TQDM_FORMAT))
-
-        select_artist = tqdm(api_result, total=len(api_result), desc="Examining results for best match...", ascii=" #",
-                             bar_format=ui.TQDM_FORMAT)
-
-        to_monitor = []
-        for artist in select_artist:
-            best_result = self.get_best_result(artist)
-            if best_result:
-                to_monitor.append(best_result)
 
-        to_process = [item for elem in to_monitor for item in elem if len(item)]
+        to_process = (known or []) + self.search_artists(names, cached)
         if self.build_artist_query(to_process):
             self.call_refresh()
         else:
             print("")
             logger.info("No new artists have been added, skipping refresh.")
 
+    def search_artists(self, names: list, cached: bool = False) -> list:
+        """
+        Return the best match for each artist name. If cached, names matched
+        by a previous import are not searched for again.
+        """
+        matches = self.db.get_artist_matches() if cached and not self.is_search else {}
+        found = []
+        to_search = []
+        now = int(time.time())
+        for name in names:
+            match = matches.get(name.lower())
+            if not match or (not match['artist_id'] and match['checked'] + NO_MATCH_TTL <= now):
+                to_search.append(name)
+            elif match['artist_id']:
+                found.append({'id': match['artist_id'], 'name': match['artist_name']})
+            else:
+                logger.debug(f"Artist {name} was not found by a recent import, skipping...")
+        if len(to_search) < len(names):
+            logger.info(f":: Using results of a previous import for {len(names) - len(to_search):,} artist(s)")
+        if not to_search:
+            return found
+
+        api_result = self.api.fetch_all(self.api.search_artist, to_search,
+                                        desc=f"Fetching artist data for {len(to_search):,} artist(s), please wait...")
+
+        select_artist = tqdm(api_result, total=len(api_result), desc="Examining results for best match...", ascii=" #",
+                             bar_format=ui.TQDM_FORMAT)
+
+        new_matches = []
+        for name, artist in zip(to_search, select_artist):
+            if not artist:
+                continue
+            best_result = [x for x in self.get_best_result(artist) or [] if len(x)]
+            found.extend(best_result)
+            if not cached:
+                continue
+            if best_result:
+                new_matches.append({'name': name.lower(), 'artist_id': best_result[0]['id'],
+                                    'artist_name': best_result[0]['name'], 'checked': now})
+            elif not artist['results']:
+                # A skipped prompt is not remembered so the user is asked again next time
+                new_matches.append({'name': name.lower(), 'artist_id': None, 'artist_name': None, 'checked': now})
+        if new_matches:
+            self.db.set_artist_matches(new_matches)
+        return found
+
+    @staticmethod
+    def read_artist_ids(import_path: Path, names: list) -> tuple:
+        """
+        Return artists whose directory contains an ARTIST_ID_FILE and the
+        names of the remaining artists
+        """
+        known = []
+        unknown = []
+        for name in names:
+            id_file = import_path / name / ARTIST_ID_FILE
+            if not id_file.is_file():
+                unknown.append(name)
+                continue
+            with open(id_file, 'r', encoding="utf-8") as f:
+                try:
+                    known.append({'id': int(f.readline().strip()), 'name': name})
+                except ValueError:
+                    logger.warning(f"   [!] Invalid artist ID in {id_file}, searching for {name} instead")
+                    unknown.append(name)
+        if known:
+            logger.info(f":: {len(known):,} artist ID(s) read from {ARTIST_ID_FILE} files")
+        return known, unknown
+
     # @performance.timeit
     def artist_ids(self, ids: list):
         ids = [int(x) for x in ids]
         if self.remove:
             return self.purge_artists(ids=ids)
-        self.debugger("SpawningThreads", self.api.max_threads)
-        with ThreadPoolExecutor(max_workers=self.api.max_threads) as ex:
-            api_result = list(
-                tqdm(ex.map(self.api.get_artist_by_id, ids), total=len(ids),
-                     desc=f"Fetching artist data for {len(ids):,} artist(s), please wait...",
-                     ascii=" #", bar_format=ui.TQDM_FORMAT))
+        api_result = self.api.fetch_all(self.api.get_artist_by_id, ids,
+                                        desc=f"Fetching artist data for {len(ids):,} artist(s), please wait...")
 
         if self.build_artist_query(api_result):
             self.call_refresh()
@@ -216,11 +284,14 @@ class Monitor:
             if isinstance(artist_list[0], int):
                 self.artist_ids(artist_list)
             else:
-                self.artists(artist_list)
+                self.artists(artist_list, cached=True)
         elif Path(import_path).is_dir():
             import_list = [x.relative_to(import_path).name for x in sorted(Path(import_path).iterdir()) if x.is_dir()]
+            if self.remove:
+                return self.artists(import_list)
             if import_list:
-                self.artists(import_list)
+                known, names = self.read_artist_ids(Path(import_path), import_list)
+                self.artists(names, known=known, cached=True)
         else:
             logger.error(f"File or directory not found: {import_path}")
             return
@@ -230,12 +301,8 @@ class Monitor:
         if self.remove:
             return self.purge_playlists(ids=playlists)
         ids = [int(x) for x in playlists]
-        self.debugger("SpawningThreads", self.api.max_threads)
-        with ThreadPoolExecutor(max_workers=self.api.max_threads) as ex:
-            api_result = list(
-                tqdm(ex.map(self.api.get_playlist, ids), total=len(ids),
-                     desc=f"Fetching playlist data for {len(ids):,} playlist(s), please wait...",
-                     ascii=" #", bar_format=ui.TQDM_FORMAT))
+        api_result = self.api.fetch_all(self.api.get_playlist, ids,
+                                        desc=f"Fetching playlist data for {len(ids):,} playlist(s), please wait...")
 
         if self.build_playlist_query(api_result, include_artists):
             self.call_refresh()
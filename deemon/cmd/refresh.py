@@ -1,34 +1,51 @@
+import json
 import logging
 import re
 import time
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
-from tqdm import tqdm
 
 from deemon.cmd.download import QueueItem, Download
 from deemon.core import db, api, notifier, common
+from deemon.core.scheduler import RefreshScheduler
 from deemon.core.config import Config as config
-from deemon.utils import dates, ui, performance
+from deemon.utils import dates, performance, metrics
 
 logger = logging.getLogger(__name__)
 
+# Number of artists processed between checkpoints of a refresh run
+CHECKPOINT_SIZE = 100
+
 
 class Refresh:
-    def __init__(self, time_machine: datetime = None, skip_download: bool = False, ignore_filters: bool = False, active_api=None):
+    def __init__(self, time_machine: datetime = None, skip_download: bool = False, ignore_filters: bool = False, active_api=None,
+                 no_cache: bool = False, full_refresh: bool = False, resume: bool = False):
         self.db = db.Database()
         self.refresh_date = datetime.now()
         self.max_refresh_date = None
-        self.api = active_api or api.PlatformAPI()
+        self.api = active_api or api.get_platform_api()
         self.new_releases = []
-        self.new_releases_alert = []
+        self.new_releases_alert = {}
         self.new_playlist_releases = []
         self.time_machine = time_machine
         self.total_new_releases = 0
         self.queue_list = []
         self.skip_download = skip_download
+        self.stream_downloads = not skip_download and not config.halt_download_on_error()
+        self.downloader = None
+        self.resume = resume
+        self.run_id = None
+        self.checkpoint = {}
+        self.checkpoint_buffer = []
+        self.downloaded = set()
         self.download_all = ignore_filters
         self.seen = None
+        self.scheduler = RefreshScheduler(self.db)
+        self.full_refresh = full_refresh or bool(time_machine) or not config.scheduler_enabled()
+
+        if no_cache and self.api.cache:
+            logger.debug("Response cache bypassed for this refresh")
+            self.api.cache.bypass = True
 
         if self.time_machine:
             logger.info(f":: Time Machine active: {datetime.strftime(self.time_machine, '%b %d, %Y')}!")
@@ -44,33 +61,29 @@ class Refresh:
                 payload = ""
             logger.debug(f"DEBUG_MODE: {message} {str(payload)}")
 
-    def remove_existing_releases(self, payload: dict, seen: dict) -> list:
+    def remove_existing_releases(self, payload: dict, seen: set) -> list:
         """
         Return list of releases that have not been stored in the database
         """
-        new_releases = []
-
         if payload.get('artist_id'):
-            seen_releases = seen
-            if seen_releases:
-                seen_releases = [v for x in seen_releases for k, v in x.items() if not x.get('future_release', 0)]
-                new_releases = [x for x in payload['releases'] if type(x) == dict for k, v in x.items() if
-                                k == "id" and v not in seen_releases]
-                return new_releases
+            if seen:
+                return [x for x in payload['releases'] if type(x) == dict and 'id' in x and x['id'] not in seen]
             return [x for x in payload['releases']]
 
         if payload.get('tracks'):
-            playlist_id = payload['id']
-            seen_releases = self.db.get_playlist_tracks(playlist_id)
-            if seen_releases:
-                seen_releases = [v for x in seen_releases for k, v in x.items()]
-                new_releases = [x for x in payload['tracks']
-                                if type(x) == dict for k, v in x.items()
-                                if k == "id" and v not in seen_releases]
-                return new_releases
+            if seen:
+                return [x for x in payload['tracks'] if type(x) == dict and 'id' in x and x['id'] not in seen]
             return [x for x in payload['tracks']]
 
-        return new_releases
+        return []
+
+    def build_seen_index(self) -> set:
+        """
+        Load album IDs already stored for the active profile into a set so each
+        release can be checked in constant time. Future releases are left out
+        so they are picked up again once their release date arrives.
+        """
+        return self.db.get_seen_album_ids()
 
     def filter_artist_releases(self, payload: dict):
         """ Inspect artist releases and decide what to do with each release """
@@ -88,20 +101,25 @@ class Refresh:
                 release['explicit_lyrics'] = 0
             
             self.append_database_release(release)
-            
-            if release['future']:
-                continue
 
-            if not common.exclude_filtered_versions([{'title': release['title']}]):
-                # exclude_filtered_versions returns empty list if excluded
-                continue
+        # An explicit release hides the other versions of its title even if it is
+        # a future or excluded release. Editions are only chosen among releases
+        # that can be queued so such an edition never hides one available now.
+        available = common.get_exclusion_matcher().filter([x for x in payload['releases'] if not x['future']])
+        explicit_ids = self.explicit_ids(payload['releases'])
+        edition_ids = self.preferred_editions(available)
 
-            explicit_album_id = self.explicit_id(release['title'], payload['releases'])
+        for release in available:
+            explicit_album_id = explicit_ids.get(release['title'])
             if explicit_album_id:
                 if explicit_album_id == release['id']:
                     logger.debug(f"An explicit release was found for {release['title']}")
                 else:
                     continue
+            elif edition_ids[(release['title'], release['record_type'])] != release['id']:
+                logger.debug(f"Skipping release {release['id']}, another edition of {release['title']} "
+                             f"has more tracks")
+                continue
 
             if self.download_all:
                 self.queue_release(release)
@@ -125,11 +143,30 @@ class Refresh:
         self.new_releases.append(new_release)
                 
     @staticmethod
-    def explicit_id(release_title: str, payload: list):
-        for release in payload:
-            if release['title'] == release_title:
-                if release['explicit_lyrics'] == 1:
-                    return release['id']
+    def explicit_ids(releases: list) -> dict:
+        """
+        Return a map of release title to the ID of the first explicit release
+        with that title
+        """
+        explicit = {}
+        for release in releases:
+            if release['explicit_lyrics'] == 1:
+                explicit.setdefault(release['title'], release['id'])
+        return explicit
+
+    @staticmethod
+    def preferred_editions(releases: list) -> dict:
+        """
+        Return a map of (title, record_type) to the ID of the preferred
+        edition: the one with the most tracks, or the first one listed
+        """
+        editions = {}
+        for release in releases:
+            key = (release['title'], release['record_type'])
+            preferred = editions.get(key)
+            if not preferred or int(release.get('nb_tracks') or 0) > int(preferred.get('nb_tracks') or 0):
+                editions[key] = release
+        return {k: v['id'] for k, v in editions.items()}
 
     def release_too_old(self, release_date: str):
         release_date_dt = dates.str_to_datetime_obj(release_date)
@@ -172,7 +209,29 @@ class Refresh:
         # Create notification of release if per-artist is set to True
         if release['alerts'] is not False and config.alerts():
             self.create_notification(release)
-        self.queue_list.append(QueueItem(release_full=release))
+        if release['id'] in self.downloaded:
+            logger.debug(f"Release {release['id']} was downloaded before the refresh was interrupted, skipping it.")
+            return
+        self.enqueue(QueueItem(release_full=release))
+
+    def enqueue(self, item: QueueItem):
+        """
+        Add item to the download queue. Unless downloads are skipped (or must
+        halt on error), releases start downloading while the refresh continues.
+        """
+        self.queue_list.append(item)
+        if not self.stream_downloads:
+            return
+        if not self.downloader:
+            self.downloader = Download(active_api=self.api, write_metrics=False)
+            self.downloader.refresh_run_id = self.run_id
+            if not self.downloader.start_stream():
+                self.stream_downloads = False
+                self.downloader = None
+                return
+            print("")
+            logger.info(":: Downloading new releases as they are found...")
+        self.downloader.stream(item)
 
     def filter_playlist_releases(self, payload: dict):
         self.debugger(f"Filtering {len(payload['tracks'])} tracks for playlist {payload['title']}")
@@ -188,7 +247,7 @@ class Refresh:
 
             queue_obj = QueueItem(playlist=payload, bitrate=payload['bitrate'], download_path=payload['download_path'])
             self.debugger("QueuePlaylistItem", queue_obj)
-            self.queue_list.append(queue_obj)
+            self.enqueue(queue_obj)
 
     def waiting_for_refresh(self):
         playlists = self.db.get_unrefreshed_playlists()
@@ -198,8 +257,10 @@ class Refresh:
 
     def prep_payload(self, p):
         if len(p):
-            p['releases'] = self.remove_existing_releases(p, self.seen)
-            self.filter_artist_releases(p)
+            with performance.span("refresh.diff"):
+                p['releases'] = self.remove_existing_releases(p, self.seen)
+            with performance.span("refresh.filter"):
+                self.filter_artist_releases(p)
         else:
             logger.debug("No payload provided")
 
@@ -214,7 +275,10 @@ class Refresh:
                                     "anyway, set `check_account_status` "
                                     "to False in the config.")
 
-        if artists:
+        resumed = self.get_resume_data() if self.resume else None
+        if resumed:
+            api_result = self.get_release_data(resumed)
+        elif artists:
             self.debugger("ManualRefresh", artists)
             monitored_artists = [x for x in (self.db.get_monitored_artist_by_name(a) for a in artists) if x]
             if not len(monitored_artists):
@@ -238,21 +302,29 @@ class Refresh:
                 monitored_artists = self.db.get_all_monitored_artists()
                 if not len(monitored_playlists) and not len(monitored_artists):
                     return logger.warning("No artists found to refresh")
-                api_result = self.get_release_data({'artists': monitored_artists, 'playlists': monitored_playlists})
-
-        if len(api_result):
-            self.seen = self.db.get_artist_releases()
-            payload_container = tqdm(api_result['artists'], total=len(api_result['artists']),
-                                     desc=f"Scanning release data for new releases...",
-                                     ascii=" #",
-                                     bar_format=ui.TQDM_FORMAT)
-            for payload in payload_container:
+                if not self.full_refresh:
+                    monitored_artists = self.scheduler.due(monitored_artists)
+                # Only a full refresh of every artist is checkpointed; a refresh of a few
+                # artists must not discard the progress of an interrupted one
+                api_result = self.get_release_data({'artists': monitored_artists, 'playlists': monitored_playlists},
+                                                   checkpoint=not self.time_machine)
+
+        # Artist releases are filtered (and downloads queued) as each artist is fetched
+        self.seen = self.build_seen_index()
+        refreshed_artists = []
+        with performance.span("refresh.process_artists"):
+            for payload in api_result['artists']:
+                # Artists whose discography couldn't be fetched stay due for the next refresh
+                if payload and not payload.get('fetch_failed'):
+                    refreshed_artists.append(payload['artist_id'])
                 self.prep_payload(payload)
+                self.checkpoint_payload(payload)
+            self.save_checkpoint()
 
         playlist_monitor_artists = []
         for payload in api_result['playlists']:
             if payload and len(payload):
-                self.seen = self.db.get_playlist_tracks(payload['id'])
+                self.seen = {x['track_id'] for x in self.db.get_playlist_tracks(payload['id'])}
                 payload['tracks'] = self.remove_existing_releases(payload, self.seen)
                 self.filter_playlist_releases(payload)
 
@@ -267,29 +339,46 @@ class Refresh:
             self.queue_list.clear()
             self.new_releases_alert.clear()
 
-        if len(self.queue_list):
-            dl = Download(active_api=self.api)
-            dl.download_queue(self.queue_list)
+        with performance.span("refresh.download"):
+            if self.downloader:
+                self.downloader.finish_stream()
+            elif len(self.queue_list):
+                dl = Download(active_api=self.api, write_metrics=False)
+                dl.refresh_run_id = self.run_id
+                dl.download_queue(self.queue_list)
 
-        if len(self.new_playlist_releases) or len(self.new_releases):
+        # Write all results from this refresh in a single transaction
+        with performance.span("refresh.db_write"), self.db.transaction():
             if len(self.new_playlist_releases):
                 logger.debug("Updating playlist releases in database...")
                 self.db.add_new_playlist_releases(self.new_playlist_releases)
             if len(self.new_releases):
                 logger.debug("Updating artist releases in database...")
                 self.db.add_new_releases(self.new_releases)
-            self.db.commit()
-            self.db_stats()
-            performance.operation_time(config.get('start_time'))
+
+            if refreshed_artists:
+                self.scheduler.update(refreshed_artists)
+
+            if self.run_id:
+                self.db.complete_refresh_run(self.run_id)
+
+        performance.increment("refresh.artists", len(refreshed_artists))
+        performance.increment("refresh.new_releases", len(self.new_releases))
+        self.db_stats()
+        performance.operation_time(config.get('start_time'))
+        performance.log_summary()
+        if len(self.new_playlist_releases) or len(self.new_releases):
             logger.info("Database is up-to-date.")
         else:
-            self.db_stats()
-            performance.operation_time(config.get('start_time'))
             logger.info("Database is up-to-date. No new releases were found.")
 
         if len(self.new_releases_alert) > 0:
-            notification = notifier.Notify(self.new_releases_alert)
-            notification.send()
+            with performance.span("refresh.notify"):
+                notification = notifier.Notify([{'release_date': k, 'releases': v}
+                                                for k, v in self.new_releases_alert.items()])
+                notification.send()
+
+        metrics.write("refresh")
 
         if playlist_monitor_artists:
             print("")
@@ -300,10 +389,11 @@ class Refresh:
             monitor.artist_ids(playlist_monitor_artists)
 
     def db_stats(self):
-        artists = len(self.db.get_all_monitored_artist_ids())
-        playlists = len(self.db.get_all_monitored_playlist_ids())
-        releases = len(self.db.get_artist_releases())
-        future = len(self.db.get_future_releases())
+        stats = self.db.get_stats()
+        artists = stats['artists']
+        playlists = stats['playlists']
+        releases = stats['releases']
+        future = stats['future']
 
         print("")
         print(f"+ Artists monitored: {artists:,}")
@@ -312,10 +402,12 @@ class Refresh:
         print(f"+ Pending future releases: {future:,}")
         print("")
 
-    def get_release_data(self, to_refresh: dict) -> dict:
+    def get_release_data(self, to_refresh: dict, checkpoint: bool = False) -> dict:
         """
-        Generate a list of dictionaries containing artist (DB) and release (API)
-        information.
+        Fetch playlist tracks and return them along with an iterator of
+        dictionaries containing artist (DB) and release (API) information.
+        Artist releases are fetched as the iterator is consumed. If checkpoint
+        is set, a new refresh run is started so the refresh can be resumed.
         """
 
         api_result = {'artists': [], 'playlists': []}
@@ -324,59 +416,81 @@ class Refresh:
 
         if to_refresh.get('playlists') and len(to_refresh.get('playlists')):
             logger.debug("Fetching playlist track data...")
-            self.debugger("SpawningThreads", self.api.max_threads)
-            with ThreadPoolExecutor(max_workers=self.api.max_threads) as ex:
-                api_result['playlists'] = list(
-                    tqdm(ex.map(self.api.get_playlist_tracks,
-                                to_refresh['playlists']),
-                         total=len(to_refresh['playlists']),
-                         desc=f"Fetching playlist track data for "
-                              f"{len(to_refresh['playlists'])} playlist(s), "
-                              "please wait...",
-                         ascii=" #",
-                         bar_format=ui.TQDM_FORMAT)
-                )
+            api_result['playlists'] = self.api.fetch_all(
+                self.api.get_playlist_tracks, to_refresh['playlists'],
+                desc=f"Fetching playlist track data for {len(to_refresh['playlists'])} playlist(s), please wait..."
+            )
 
         if to_refresh.get('artists') and len(to_refresh['artists']):
-            logger.debug("Fetching artist release data...")
-            self.debugger("SpawningThreads", self.api.max_threads)
-            with ThreadPoolExecutor(max_workers=self.api.max_threads) as ex:
-                api_result['artists'] = list(
-                    tqdm(ex.map(self.api.get_artist_albums, to_refresh['artists']),
-                         total=len(to_refresh['artists']), desc=f"Fetching artist release data for {len(to_refresh['artists']):,} artist(s), please wait...", ascii=" #",
-                         bar_format=ui.TQDM_FORMAT)
-                )
+            if checkpoint and not self.run_id:
+                if self.db.get_interrupted_refresh_run():
+                    logger.info("   [!] Discarding progress of an interrupted refresh (use --resume to continue it)")
+                self.run_id = self.db.start_refresh_run([x['artist_id'] for x in to_refresh['artists']])
+            api_result['artists'] = self.iter_artist_releases(to_refresh['artists'])
         return api_result
 
+    def iter_artist_releases(self, artists: list):
+        for artist in artists:
+            if artist['artist_id'] in self.checkpoint:
+                payload = artist.copy()
+                payload['releases'] = self.checkpoint[artist['artist_id']]
+                yield payload
+
+        pending = [x for x in artists if x['artist_id'] not in self.checkpoint]
+        if not pending:
+            return
+        logger.debug("Fetching artist release data...")
+        yield from self.api.iter_all(
+            self.api.get_artist_albums, pending,
+            desc=f"Fetching artist release data for {len(pending):,} artist(s), please wait..."
+        )
+        if self.api.cache:
+            self.api.cache.prune()
+
+    def get_resume_data(self):
+        """
+        Load the artists of an interrupted refresh run along with the releases
+        already found for artists that were processed before it stopped, and
+        which of them were already downloaded
+        """
+        run = self.db.get_interrupted_refresh_run()
+        if not run:
+            logger.info("   [!] No interrupted refresh was found, starting a new refresh")
+            return
+        run_artists = self.db.get_refresh_run_artists(run['id'])
+        self.checkpoint = {x['artist_id']: json.loads(x['releases']) for x in run_artists if x['releases'] is not None}
+        run_artist_ids = {x['artist_id'] for x in run_artists}
+        artists = [x for x in self.db.get_all_monitored_artists() if x['artist_id'] in run_artist_ids]
+        if not artists:
+            return
+        self.run_id = run['id']
+        self.downloaded = self.db.get_refresh_run_releases(run['id'])
+        logger.info(f":: Resuming interrupted refresh, {len(self.checkpoint):,} of {len(artists):,} "
+                    f"artist(s) already processed")
+        return {'artists': artists, 'playlists': self.db.get_all_monitored_playlists()}
+
+    def checkpoint_payload(self, payload: dict):
+        """ Buffer new releases for an artist and save them every CHECKPOINT_SIZE artists """
+        if not self.run_id or not payload or payload.get('fetch_failed') or payload['artist_id'] in self.checkpoint:
+            return
+        self.checkpoint_buffer.append({'artist_id': payload['artist_id'], 'releases': json.dumps(payload['releases'])})
+        if len(self.checkpoint_buffer) >= CHECKPOINT_SIZE:
+            self.save_checkpoint()
+
+    def save_checkpoint(self):
+        if self.checkpoint_buffer:
+            self.db.checkpoint_refresh_run(self.run_id, self.checkpoint_buffer)
+            self.checkpoint_buffer = []
+
     def create_notification(self, release: dict):
-        for days in self.new_releases_alert:
-            for key in days:
-                if key == "release_date":
-                    if release['release_date'] in days[key]:
-                        days["releases"].append(
-                            {
-                                'artist': release['artist_name'],
-                                'album': release['title'],
-                                'cover': release['cover_big'],
-                                'url': release['link'],
-                                'track_num': release.get('nb_tracks', None),
-                                'record_type': release['record_type'],
-                            }
-                        )
-                        return
-
-        self.new_releases_alert.append(
+        """ Add release to the alert, grouped by release date """
+        self.new_releases_alert.setdefault(release['release_date'], []).append(
             {
-                'release_date': release['release_date'], 
-                'releases': [
-                    {
-                        'artist': release['artist_name'],
-                        'album': release['title'],
-                        'cover': release['cover_big'],
-                        'url': release['link'],
-                        'track_num': release.get('nb_tracks', None),
-                        'record_type': release['record_type'],
-                    }
-                ]
+                'artist': release['artist_name'],
+                'album': release['title'],
+                'cover': release['cover_big'],
+                'url': release['link'],
+                'track_num': release.get('nb_tracks', None),
+                'record_type': release['record_type'],
             }
         )
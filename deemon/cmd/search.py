@@ -1,11 +1,9 @@
 import logging
 import sys
 
-from deezer import Deezer
-
 from deemon.cmd import download
 from deemon.cmd import monitor as mon
-from deemon.core import db, api
+from deemon.core import db, api, session
 from deemon.core.config import Config as config
 from deemon.utils import dates
 
@@ -14,7 +12,7 @@ logger = logging.getLogger(__name__)
 
 class Search:
     def __init__(self, active_api=None):
-        self.api = active_api or api.PlatformAPI()
+        self.api = active_api or api.get_platform_api()
         self.artist_id: int = None
         self.artist: str = None
         self.choices: list = []
@@ -33,7 +31,7 @@ class Search:
         self.eq_year = None
 
         self.db = db.Database()
-        self.dz = Deezer()
+        self.dz = session.get_session()
 
     @staticmethod
     def truncate_artist(name: str):
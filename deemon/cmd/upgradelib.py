@@ -1,17 +1,22 @@
+import os
 import sys
+import threading
 import time
 import logging
 from datetime import timedelta
+from functools import wraps
 from pathlib import Path
+import mutagen
 from mutagen.easyid3 import EasyID3
 from itertools import groupby
 from operator import itemgetter
 from deezer import Deezer
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
 from unidecode import unidecode
 from tqdm import tqdm
 from deemon.core.common import exclude_filtered_versions
 from deemon.core.config import Config as config
+from deemon.core.db import Database
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +26,12 @@ LIBRARY_ROOT = None
 ALBUM_ONLY = None
 ALLOW_EXCLUSIONS = None
 
+# File types read through mutagen's easy tag interface
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.m4a')
+
+# Files handed to a worker at a time, keeping process pool overhead low
+SCAN_BATCH_SIZE = 200
+
 # TODO - Add an 'exclusions' key to albums/tracks for count
 # TODO - to improve album title matching, extract all a-zA-Z0-9 and compare (remove special chars)
 
@@ -62,12 +73,17 @@ class Performance:
 def read_metadata(file):
     metadata = {
         'abs_path': file,
-        'rel_path': str(file).replace(LIBRARY_ROOT, ".."),
         'error': None
     }
 
     try:
-        _audio = EasyID3(file)
+        if file.lower().endswith(".mp3"):
+            # Only the ID3 tag is needed; skip parsing MPEG frames
+            _audio = EasyID3(file)
+        else:
+            _audio = mutagen.File(file, easy=True)
+            if _audio is None:
+                raise ValueError("Unsupported file type")
 
         # Remove featured artists from artist tag
         metadata['artist'] = _audio['artist'][0].split("/")[0].strip()
@@ -76,11 +92,126 @@ def read_metadata(file):
         metadata['album'] = _audio['album'][0].replace("_", " ").strip()
         metadata['title'] = _audio['title'][0].strip()
     except Exception as e:
-        metadata['error'] = e
+        # Stored as text so results can be cached and passed between processes
+        metadata['error'] = str(e)
 
     return metadata
 
 
+def read_metadata_batch(files: list) -> list:
+    """ Read tags for a batch of (path, mtime, size) tuples """
+    result = []
+    for path, mtime, size in files:
+        metadata = read_metadata(path)
+        metadata['mtime'] = mtime
+        metadata['size'] = size
+        result.append(metadata)
+    return result
+
+
+def scan_files(root: str):
+    """ Yield path and stat result of audio files below root, skipping hidden files """
+    directories = [root]
+    while directories:
+        try:
+            entries = os.scandir(directories.pop())
+        except OSError as e:
+            logger.debug(f"Unable to scan directory: {e}")
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    directories.append(entry.path)
+                elif entry.name.lower().endswith(AUDIO_EXTENSIONS) and not entry.name.startswith("."):
+                    yield entry.path, entry.stat()
+
+
+def read_library(root: str, processes: bool = False):
+    """
+    Yield metadata for every audio file below root as it is read. Tags are
+    only read from files that are new or have changed since the last scan.
+    """
+    db = Database()
+    scan_cache = db.get_library_scan()
+    seen = set()
+    updated = []
+    pending = set()
+    batch = []
+
+    if processes:
+        workers = os.cpu_count() or 1
+        executor = ProcessPoolExecutor(workers)
+    else:
+        workers = 10
+        executor = ThreadPoolExecutor(workers)
+
+    def completed(block: bool = False):
+        nonlocal pending
+        if not pending:
+            return
+        done, pending = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            for metadata in future.result():
+                updated.append(metadata)
+                yield metadata
+
+    with executor:
+        for path, stat in scan_files(root):
+            seen.add(path)
+            cached = scan_cache.get(path)
+            if cached and cached[1] == stat.st_mtime_ns and cached[2] == stat.st_size:
+                yield {'abs_path': path, 'artist': cached[3], 'album': cached[4], 'title': cached[5],
+                       'error': cached[6]}
+                continue
+            batch.append((path, stat.st_mtime_ns, stat.st_size))
+            if len(batch) >= SCAN_BATCH_SIZE:
+                pending.add(executor.submit(read_metadata_batch, batch))
+                batch = []
+                yield from completed(block=len(pending) >= workers * 2)
+        if batch:
+            pending.add(executor.submit(read_metadata_batch, batch))
+        while pending:
+            yield from completed(block=True)
+
+    removed = [x for x in scan_cache if x.startswith(os.path.join(root, "")) and x not in seen]
+    with db.transaction():
+        db.set_library_scan([{'path': x['abs_path'], 'mtime': x['mtime'], 'size': x['size'],
+                              'artist': x.get('artist'), 'album': x.get('album'), 'title': x.get('title'),
+                              'error': x['error']} for x in updated])
+        db.remove_library_scan(removed)
+    logger.debug(f"Library scan: {len(seen) - len(updated):,} cached, {len(updated):,} read, "
+                 f"{len(removed):,} removed")
+
+
+def memoize(func):
+    """
+    Cache results by arguments for the duration of a run. Worker threads
+    asking for the same key wait for the first call instead of repeating it.
+    """
+    results = {}
+    key_locks = {}
+    lock = threading.Lock()
+
+    @wraps(func)
+    def wrapper(*args):
+        if args in results:
+            return results[args]
+        with lock:
+            key_lock = key_locks.setdefault(args, threading.Lock())
+        with key_lock:
+            if args not in results:
+                results[args] = func(*args)
+        return results[args]
+
+    def cache_clear():
+        with lock:
+            results.clear()
+            key_locks.clear()
+
+    wrapper.cache_clear = cache_clear
+    return wrapper
+
+
 def get_time_from_secs(secs):
     td_str = str(timedelta(seconds=secs))
     x = td_str.split(":")
@@ -105,9 +236,15 @@ def invalid_metadata(track: dict) -> bool:
         return False
 
 
+@memoize
+def search_api(query: str) -> dict:
+    """ Search results are shared by artist and discography lookups """
+    return dz.gw.search(query)
+
+
 def get_artist_api(name: str) -> list:
     """ Get list of artists with exact name matches from API """
-    artist_api = dz.gw.search(name)['ARTIST']['data']
+    artist_api = search_api(name)['ARTIST']['data']
     artist_matches = []
 
     for artist in artist_api:
@@ -117,13 +254,15 @@ def get_artist_api(name: str) -> list:
     return artist_matches
 
 
+@memoize
 def get_artist_discography_api(artist_name, artist_id) -> list:
     """ Get list of albums with exact name matches from API """
-    album_search = dz.gw.search(artist_name)['ALBUM']['data']
+    album_search = search_api(artist_name)['ALBUM']['data']
     album_gw = dz.gw.get_artist_discography(artist_id)['data']
     album_api = dz.api.get_artist_albums(artist_id)['data']
 
     albums = []
+    album_ids = set()
 
     for album in album_api:
         if album['record_type'] == 'single':
@@ -147,28 +286,47 @@ def get_artist_discography_api(artist_name, artist_id) -> list:
             'TYPE': album['record_type']
         }
         albums.append(alb)
+        album_ids.add(alb['ALB_ID'])
 
     for album in album_gw:
-        if album['ALB_ID'] not in [x['ALB_ID'] for x in albums]:
+        if album['ALB_ID'] not in album_ids:
             albums.append(album)
+            album_ids.add(album['ALB_ID'])
 
     for album in album_search:
         if album['ART_ID'] == artist_id:
-            if album['ALB_ID'] not in [x['ALB_ID'] for x in albums]:
-                # Album returned via Search is missing EXPLICIT_LYRICS key
+            if album['ALB_ID'] not in album_ids:
+                # Album returned via Search is missing EXPLICIT_LYRICS key; copy so
+                # the cached search result is left untouched
                 if not album.get('EXPLICIT_LYRICS'):
-                    album['EXPLICIT_LYRICS'] = '0'
+                    album = dict(album, EXPLICIT_LYRICS='0')
                 albums.append(album)
+                album_ids.add(album['ALB_ID'])
 
     return albums
 
 
+@memoize
 def get_album_tracklist_api(album_id: str) -> list:
     """ Get tracklist for album based on album_id """
     tracklist_api = dz.gw.get_album_tracks(album_id)
     return tracklist_api
 
 
+@memoize
+def get_tracklist_index(album_id: str) -> dict:
+    """
+    Map lowercase track titles, with and without version, to the position
+    and ID of the first track in the album using that title
+    """
+    index = {}
+    for i, track_api in enumerate(get_album_tracklist_api(album_id)):
+        index.setdefault(track_api['SNG_TITLE'].lower(), (i, track_api['SNG_ID']))
+        index.setdefault(f"{track_api['SNG_TITLE']} {track_api.get('VERSION', '')}".lower(),
+                         (i, track_api['SNG_ID']))
+    return index
+
+
 def retrieve_track_ids_per_artist(discography: tuple):
     artist = discography[0]
     albums = discography[1]
@@ -208,7 +366,7 @@ def retrieve_track_ids_per_artist(discography: tuple):
                 api_album_matches = [alb for alb in discog if alb['ALB_TITLE'].lower() == album.lower()]
 
                 if ALLOW_EXCLUSIONS:
-                    filtered_album_matches = exclude_filtered_versions(api_album_matches)
+                    filtered_album_matches = exclude_filtered_versions(api_album_matches, key='ALB_TITLE')
                     api_album = get_preferred_album(filtered_album_matches, len(tracks))
                 else:
                     api_album = get_preferred_album(api_album_matches, len(tracks))
@@ -228,28 +386,19 @@ def retrieve_track_ids_per_artist(discography: tuple):
                         continue
 
                 if api_album:
-                    tracklist = get_album_tracklist_api(api_album['ALB_ID'])
+                    tracklist_index = get_tracklist_index(api_album['ALB_ID'])
                     for track in tracks:
                         track_variations = [track['title'].lower(), unidecode(track['title']).lower()]
-
-                        for i, track_api in enumerate(tracklist, start=1):
-                            if track_api['SNG_TITLE'].lower() in track_variations:
-                                found_artist = True
-                                track['id'] = track_api['SNG_ID']
-                                track_ids.append(track)
-                                break
-
-                            elif f"{track_api['SNG_TITLE']} {track_api.get('VERSION', '')}".lower() in track_variations:
-                                found_artist = True
-                                track['id'] = track_api['SNG_ID']
-                                track_ids.append(track)
-                                break
-
-                            if i == len(tracklist):
-                                track['info'] = "Track not found"
-                                tqdm.write(f"{track['info']}: {track['title']}")
-                                track_ids.append(track)
-                                break
+                        # Earliest track in the album matching either variation
+                        matches = [tracklist_index[x] for x in track_variations if x in tracklist_index]
+
+                        if matches:
+                            found_artist = True
+                            track['id'] = min(matches)[1]
+                        else:
+                            track['info'] = "Track not found"
+                            tqdm.write(f"{track['info']}: {track['title']}")
+                        track_ids.append(track)
                 else:
                     if duplicate_artists:
                         info = f"Album not found under artist ID {api_artist['ART_ID']}"
@@ -304,7 +453,7 @@ def get_preferred_track_id(title: str, tracklist: list):
     return track_id
 
 
-def upgrade(library, output, albums=False, exclusions=False):
+def upgrade(library, output, albums=False, exclusions=False, processes=False):
 
     global ALBUM_ONLY
     global ALLOW_EXCLUSIONS
@@ -312,39 +461,37 @@ def upgrade(library, output, albums=False, exclusions=False):
 
     ALBUM_ONLY = albums
     ALLOW_EXCLUSIONS = exclusions
-    LIBRARY_ROOT = library
+    LIBRARY_ROOT = os.path.abspath(library)
 
     output_ids = Path(output) / "library_upgrade_ids.txt"
     output_log = Path(output) / "library_upgrade.log"
 
+    for cached in (search_api, get_artist_discography_api, get_album_tracklist_api, get_tracklist_index):
+        cached.cache_clear()
+
     perf = Performance()
     logger.info("Scanning library, standby...")
     logger.debug(f"Library path: {LIBRARY_ROOT}")
-    library_files = Path(LIBRARY_ROOT).glob("**/*.mp3")
-    files = [file for file in library_files if not file.name.startswith(".")]
-    files.sort()
+
+    perf.start('ID3')
+    files = list(tqdm(read_library(LIBRARY_ROOT, processes), desc="Reading metadata", unit=" files"))
+    perf.end('ID3')
 
     if files:
-        print(f"Found {len(files)} MP3 files")
+        print(f"Found {len(files)} audio files")
     else:
-        print("No MP3 files found")
+        print("No audio files found")
         sys.exit()
 
-    perf.start('ID3')
-    with ThreadPoolExecutor(10) as executor:
-        library_metadata = list(
-            tqdm(
-                executor.map(read_metadata, files),
-                total=(len(files)),
-                desc="Reading metadata",
-            )
-        )
-    perf.end('ID3')
+    for file in files:
+        file['rel_path'] = file['abs_path'].replace(LIBRARY_ROOT, "..")
+    library_metadata = files
 
     library_metadata_errors = [file for file in library_metadata if file.get('error')]
     library_metadata = [file for file in library_metadata if not file.get('error')]
 
-    artists = sorted(library_metadata, key=itemgetter('artist'))
+    # Files are read in no particular order; keep each album's tracks together
+    artists = sorted(library_metadata, key=itemgetter('artist', 'album'))
     artist_list = [(artist, list(albums)) for artist, albums in groupby(artists, key=itemgetter('artist'))]
 
     perf.start('API')
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import queue
+import re
+import threading
+
+import aiohttp
+import deezer.errors
+from tqdm import tqdm
+
+from deemon.core import ratelimit
+from deemon.core.api import PlatformAPI
+from deemon.core.config import Config as config
+from deemon.utils import performance, ui
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPlatformAPI(PlatformAPI):
+    """
+    PlatformAPI backend that runs bulk lookups on a single pooled aiohttp
+    session. Single lookups fall back to the synchronous deezer client.
+    """
+
+    GW_URL = "http://www.deezer.com/ajax/gw-light.php"
+    API_URL = "https://api.deezer.com/"
+
+    ASYNC_METHODS = ['get_artist_albums', 'get_playlist_tracks', 'get_artist_by_id', 'search_artist']
+
+    def __init__(self):
+        super().__init__()
+        self.max_concurrency = config.async_api_concurrency()
+        self.limiter = ratelimit.get_limiter(self.max_concurrency)
+        self.session = None
+        self.gw_token = None
+        self.gw_token_lock = None
+        logger.debug(f"Using async API backend, max_concurrency set to {self.max_concurrency}")
+
+    def fetch_all(self, method, items: list, desc: str) -> list:
+        """
+        Call an API method for each item, returning results in the same order
+        """
+        if method.__name__ not in self.ASYNC_METHODS:
+            return super().fetch_all(method, items, desc)
+        return asyncio.run(self._fetch_all(method.__name__, items, desc))
+
+    def iter_all(self, method, items: list, desc: str):
+        """
+        Call an API method for each item, yielding results as they complete.
+        The event loop runs in a background thread and stops issuing new
+        requests while the consumer is behind.
+        """
+        if method.__name__ not in self.ASYNC_METHODS:
+            yield from super().iter_all(method, items, desc)
+            return
+
+        results = queue.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                asyncio.run(self._fetch_all(method.__name__, items, desc, sink=results.put,
+                                            backlog=results.qsize, stop=stop))
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(done)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                result = results.get()
+                if result is done:
+                    break
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+        finally:
+            stop.set()
+            producer.join()
+
+    async def _fetch_all(self, method_name: str, items: list, desc: str, sink=None, backlog=None, stop=None) -> list:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=30)
+        coro = getattr(self, f"_{method_name}")
+        progress = tqdm(total=len(items), desc=desc, ascii=" #", bar_format=ui.TQDM_FORMAT)
+
+        async def run(item):
+            async with semaphore:
+                # When streaming, wait for the consumer to catch up before sending more requests
+                while backlog and backlog() >= self.max_concurrency and not stop.is_set():
+                    await asyncio.sleep(0.05)
+                if stop and stop.is_set():
+                    return
+                result = await coro(item)
+            progress.update(1)
+            if sink:
+                sink(result)
+                return
+            return result
+
+        self.gw_token = None
+        self.gw_token_lock = asyncio.Lock()
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=self.dz.http_headers) as session:
+            self.session = session
+            try:
+                return await asyncio.gather(*(run(item) for item in items))
+            finally:
+                self.session = None
+                progress.close()
+                logger.debug(f"API stats: {self.limiter.summary()}")
+
+    async def call_async(self, func, *args, **kwargs):
+        """ Await an API coroutine through the shared rate limiter """
+        # Name spans after the GW method or REST path, without IDs
+        endpoint = re.sub(r'/\d+', '/{id}', args[0]) if args and isinstance(args[0], str) else func.__name__
+        with performance.span(f"api.{endpoint}", category="api"):
+            try:
+                return await self.limiter.call_async(func, *args, **kwargs)
+            except Exception:
+                performance.increment(f"api.{endpoint}.errors")
+                raise
+
+    async def gw_call(self, method: str, args: dict = None, retry: bool = True):
+        if args is None:
+            args = {}
+        if not self.gw_token:
+            async with self.gw_token_lock:
+                if not self.gw_token:
+                    self.gw_token = await self._gw_token()
+        params = {'api_version': "1.0", 'api_token': self.gw_token, 'input': '3', 'method': method}
+        async with self.session.post(self.GW_URL, params=params, json=args) as response:
+            result = json.loads(await response.text())
+        if len(result['error']):
+            if retry and (result['error'] == {"GATEWAY_ERROR": "invalid api token"} or
+                          result['error'] == {"VALID_TOKEN_REQUIRED": "Invalid CSRF token"}):
+                self.gw_token = None
+                return await self.gw_call(method, args, retry=False)
+            if result.get('payload', {}) and result['payload'].get('FALLBACK', {}):
+                args.update(result['payload']['FALLBACK'])
+                return await self.gw_call(method, args, retry=False)
+            raise deezer.errors.GWAPIError(json.dumps(result['error']))
+        return result['results']
+
+    async def _gw_token(self) -> str:
+        params = {'api_version': "1.0", 'api_token': 'null', 'input': '3', 'method': 'deezer.getUserData'}
+        async with self.session.post(self.GW_URL, params=params, json={}) as response:
+            result = json.loads(await response.text())
+        return result['results']['checkForm']
+
+    async def api_call(self, method: str, args: dict = None):
+        async with self.session.get(self.API_URL + method, params=args) as response:
+            result = json.loads(await response.text())
+        if 'error' in result:
+            code = result['error'].get('code')
+            if code == 200:
+                raise deezer.errors.PermissionException(f"PermissionException: {method}")
+            if code == 800:
+                raise deezer.errors.DataException(f"DataException: {method}")
+            raise deezer.errors.APIError(json.dumps(result['error']))
+        return result
+
+    async def _get_artist_albums(self, query: dict, limit: int = -1):
+        self.debugger(f"Refreshing artist releases for {query['artist_name']} ({query['artist_id']})")
+        if self.get_cached_releases(query):
+            return query
+        if self.platform == "deezer-gw":
+            args = {'ART_ID': query['artist_id'], 'discography_mode': "all", 'nb': limit, 'nb_songs': 0, 'start': 0}
+            try:
+                result = (await self.call_async(self.gw_call, 'album.getDiscography', args))['data']
+            except deezer.errors.GWAPIError as e:
+                logger.debug(e)
+                if "UNKNOWN" in str(e):
+                    logger.warning(f"   [!] Artist discography is not available for "
+                                   f"{query['artist_name']} ({query['artist_id']})")
+                else:
+                    logger.error(f"An error occured while attempting to get the discography for "
+                                 f"{query['artist_name']} ({query['artist_id']})")
+                    query['fetch_failed'] = True
+                query['releases'] = []
+                return query
+            except (json.decoder.JSONDecodeError, aiohttp.ClientError, asyncio.TimeoutError):
+                logger.error(f"   [!] API still sending empty response for discography for {query['artist_name']}")
+                query['releases'] = []
+                query['fetch_failed'] = True
+                return query
+            query['releases'] = self.parse_gw_discography(query, result)
+        else:
+            result = await self.call_async(self.api_call, f"artist/{query['artist_id']}/albums",
+                                           {'index': 0, 'limit': limit})
+            query['releases'] = result['data']
+        self.cache_releases(query)
+        return query
+
+    async def _get_playlist_tracks(self, query: dict):
+        method = f"playlist/{query['id']}/tracks"
+        try:
+            result = await self.call_async(self.api_call, method, {'index': 0, 'limit': -1})
+        except deezer.errors.PermissionException:
+            logger.warning(f"   [!] Permission Denied: Playlist {query['title']} ({query['id']}) is private")
+            return
+        except deezer.errors.DataException:
+            logger.warning(f"   [!] Playlist ID {query} was not found")
+            return
+        except (json.decoder.JSONDecodeError, aiohttp.ClientError, asyncio.TimeoutError):
+            logger.error(f"   [!] API still sending empty response while getting data for playlist ID {query['id']}")
+            return
+        query['tracks'] = self.parse_playlist_tracks(result['data'])
+        return query
+
+    async def _get_artist_by_id(self, query: int):
+        if self.platform == "deezer-gw":
+            try:
+                result = await self.call_async(self.gw_call, 'artist.getData', {'ART_ID': query})
+            except deezer.errors.GWAPIError as e:
+                logger.debug(f"API error on artist ID {query}: {e}")
+                return
+            except (json.decoder.JSONDecodeError, aiohttp.ClientError, asyncio.TimeoutError):
+                logger.error(f"   [!] API still sending empty response for artist ID {query}")
+                return
+            return {'id': int(result['ART_ID']), 'name': result['ART_NAME']}
+        else:
+            try:
+                result = await self.call_async(self.api_call, f"artist/{query}")
+            except deezer.errors.DataException as e:
+                logger.debug(f"API error: {e}")
+                return
+            return {'id': result['id'], 'name': result['name']}
+
+    async def _search_artist(self, query: str, limit: int = 5):
+        if self.platform == "deezer-gw":
+            api_result = []
+            args = {"query": query, "start": 0, "nb": 10, "suggest": True, "artist_suggest": True, "top_tracks": True}
+            try:
+                logger.info(f"Searching for {query}, please wait...")
+                result = (await self.call_async(self.gw_call, 'deezer.pageSearch', args))['ARTIST']['data'][:limit]
+            except (json.decoder.JSONDecodeError, aiohttp.ClientError, asyncio.TimeoutError):
+                logger.error(f"   [!] API still sending empty response while searching for artist {query}")
+                return []
+            for r in result:
+                api_result.append({'id': int(r['ART_ID']), 'name': r['ART_NAME']})
+        else:
+            result = await self.call_async(self.api_call, 'search/artist', {'q': query, 'index': 0, 'limit': limit})
+            api_result = result['data']
+
+        return {'query': query, 'results': api_result}
@@ -1,23 +1,44 @@
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
+from itertools import islice
 
 import deezer.errors
-from deezer import Deezer
+from tqdm import tqdm
 
+from deemon.core import cache, db, ratelimit, session
 from deemon.core.config import Config as config
+from deemon.utils import performance, ui
 
 logger = logging.getLogger(__name__)
 
 
+def get_platform_api():
+    """
+    Return the API backend selected by the api_backend config option
+    """
+    if config.api_backend() == "async":
+        try:
+            from deemon.core.aioapi import AsyncPlatformAPI
+        except ImportError:
+            logger.warning("   [!] The async API backend requires aiohttp (pip install deemon[async]), "
+                           "falling back to threaded backend")
+        else:
+            return AsyncPlatformAPI()
+    return PlatformAPI()
+
+
 class PlatformAPI:
 
     def __init__(self):
         self.max_threads = 2
-        self.dz = Deezer()
+        self.dz = session.get_session()
         self.platform = self.get_platform()
         self.account_type = None
         self.api = self.set_platform()
+        self.limiter = ratelimit.get_limiter(self.max_threads)
+        self.cache = cache.get_cache()
         
         if config.check_account_status():
             self.account_type = self.get_account_type()
@@ -28,6 +49,58 @@ class PlatformAPI:
                 payload = ""
             logger.debug(f"DEBUG_MODE: {message} {str(payload)}")
             
+    def fetch_all(self, method, items: list, desc: str) -> list:
+        """
+        Call an API method for each item, returning results in the same order
+        """
+        self.debugger("SpawningThreads", self.max_threads)
+        with ThreadPoolExecutor(max_workers=self.max_threads) as ex:
+            result = list(
+                tqdm(ex.map(method, items), total=len(items), desc=desc,
+                     ascii=" #", bar_format=ui.TQDM_FORMAT)
+            )
+        logger.debug(f"API stats: {self.limiter.summary()}")
+        return result
+
+    def iter_all(self, method, items: list, desc: str):
+        """
+        Call an API method for each item, yielding results as they complete.
+        Only a small window of requests is submitted ahead of the consumer so
+        results do not pile up in memory.
+        """
+        self.debugger("SpawningThreads", self.max_threads)
+        progress = tqdm(total=len(items), desc=desc, ascii=" #", bar_format=ui.TQDM_FORMAT)
+        remaining = iter(items)
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.max_threads) as ex:
+            try:
+                while True:
+                    for item in islice(remaining, self.max_threads * 2 - len(pending)):
+                        pending.add(ex.submit(method, item))
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        progress.update(1)
+                        yield future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
+                progress.close()
+        logger.debug(f"API stats: {self.limiter.summary()}")
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call the underlying API through the shared rate limiter, retrying
+        empty or throttled responses with backoff
+        """
+        with performance.span(f"api.{func.__name__}", category="api"):
+            try:
+                return self.limiter.call(func, *args, **kwargs)
+            except Exception:
+                performance.increment(f"api.{func.__name__}.errors")
+                raise
+
     def get_platform(self):
         if config.fast_api():
             return "deezer-gw"
@@ -47,18 +120,25 @@ class PlatformAPI:
             return self.dz.api
         
     def get_account_type(self):
+        if not config.arl():
+            logger.debug("No ARL configured, assuming free account")
+            return "free"
+
+        database = db.Database()
+        account_type = session.get_cached_account_type(database, config.arl())
+        if account_type:
+            logger.debug(f"Deezer account type is \"{account_type}\" (cached)")
+            return account_type
+
         logger.info("Verifying ARL, please wait...")
-        temp_dz = Deezer()
-        temp_dz.login_via_arl(config.arl())
-        if temp_dz.get_session()['current_user'].get('can_stream_lossless'):
-            logger.debug(f"Deezer account type is \"Hi-Fi\"")
-            return "hifi"
-        elif temp_dz.get_session()['current_user'].get('can_stream_hq'):
-            logger.debug(f"Deezer account type is \"Premium\"")
-            return "premium"
-        else:
-            logger.debug(f"Deezer account type is \"Free\"")
+        dz = session.get_session(config.arl())
+        if not dz:
+            logger.debug("Unable to verify ARL, assuming free account")
             return "free"
+        account_type = session.account_type(dz)
+        logger.debug(f"Deezer account type is \"{account_type}\"")
+        session.set_cached_account_type(database, config.arl(), account_type)
+        return account_type
 
     #TODO GW API appears to ignore limit; must implement afterwards
     def search_artist(self, query: str, limit: int = 5):
@@ -69,18 +149,14 @@ class PlatformAPI:
             api_result = []
             try:
                 logger.info(f"Searching for {query}, please wait...")
-                result = self.api.search(query=query)['ARTIST']['data'][:limit]
+                result = self.call(self.api.search, query=query)['ARTIST']['data'][:limit]
             except json.decoder.JSONDecodeError:
-                logger.error(f"   [!] Empty response from API while searching for artist {query}, retrying...")
-                try:
-                    result = self.api.search(query=query)['ARTIST']['data'][:limit]
-                except json.decoder.JSONDecodeError:
-                    logger.error(f"   [!] API still sending empty response while searching for artist {query}")
-                    return []
+                logger.error(f"   [!] API still sending empty response while searching for artist {query}")
+                return []
             for r in result:
                 api_result.append({'id': int(r['ART_ID']), 'name': r['ART_NAME']})
         else:
-            api_result = self.api.search_artist(query=query, limit=limit)['data']
+            api_result = self.call(self.api.search_artist, query=query, limit=limit)['data']
 
         return {'query': query, 'results': api_result}
 
@@ -90,21 +166,17 @@ class PlatformAPI:
         """
         if self.platform == "deezer-gw":
             try:
-                result = self.api.get_artist(query)
+                result = self.call(self.api.get_artist, query)
             except deezer.errors.GWAPIError as e:
                 logger.debug(f"API error on artist ID {query}: {e}")
                 return
             except json.decoder.JSONDecodeError:
-                logger.error(f"   [!] Empty response from API while getting data for artist ID {query}, retrying...")
-                try:
-                    result = self.api.get_artist(query)
-                except json.decoder.JSONDecodeError:
-                    logger.error(f"   [!] API still sending empty response for artist ID {query}")
-                    return
+                logger.error(f"   [!] API still sending empty response for artist ID {query}")
+                return
             return {'id': int(result['ART_ID']), 'name': result['ART_NAME']}
         else:
             try:
-                result = self.api.get_artist(query)
+                result = self.call(self.api.get_artist, query)
             except deezer.errors.DataException as e:
                 logger.debug(f"API error: {e}")
                 return
@@ -114,21 +186,17 @@ class PlatformAPI:
         """Return a dictionary from API containing album info"""
         if self.platform == "deezer-gw":
             try:
-                result = self.api.get_album(query)
+                result = self.call(self.api.get_album, query)
             except deezer.errors.GWAPIError as e:
                 logger.debug(f"API error: {e}")
                 return {}
             except json.decoder.JSONDecodeError:
-                logger.error(f"   [!] Empty response from API while getting data for album ID {query}, retrying...")
-                try:
-                    result = self.api.get_album(query)
-                except json.decoder.JSONDecodeError:
-                    logger.error(f"   [!] API still sending empty response for album ID {query}")
-                    return {}
+                logger.error(f"   [!] API still sending empty response for album ID {query}")
+                return {}
             return {'id': int(result['ALB_ID']), 'title': result['ALB_TITLE'], 'artist': {'name': result['ART_NAME']}}
         else:
             try:
-                result = self.api.get_album(query)
+                result = self.call(self.api.get_album, query)
             except deezer.errors.DataException as e:
                 logger.debug(f"API error: {e}")
                 return
@@ -139,21 +207,17 @@ class PlatformAPI:
         """Return a dictionary from API containing album info"""
         if self.platform == "deezer-gw":
             try:
-                result = self.api.get_track(query)
+                result = self.call(self.api.get_track, query)
             except deezer.errors.GWAPIError as e:
                 logger.debug(f"API error: {e}")
                 return {}
             except json.decoder.JSONDecodeError:
-                logger.error(f"   [!] Empty response from API while getting data for album ID {query}, retrying...")
-                try:
-                    result = self.api.get_album(query)
-                except json.decoder.JSONDecodeError:
-                    logger.error(f"   [!] API still sending empty response for album ID {query}")
-                    return {}
+                logger.error(f"   [!] API still sending empty response for track ID {query}")
+                return {}
             return {'id': int(result['SNG_ID']), 'title': result['SNG_TITLE'], 'artist': {'name': result['ART_NAME']}}
         else:
             try:
-                result = self.api.get_track(query)
+                result = self.call(self.api.get_track, query)
             except deezer.errors.DataException as e:
                 logger.debug(f"API error: {e}")
             else:
@@ -162,24 +226,91 @@ class PlatformAPI:
     def get_extra_release_info(self, query: dict):
         album = {'id': query['album_id'], 'label': None}
         if self.platform == "deezer-gw":
-            album_details = self.api.get_album(query['album_id'])
+            album_details = self.call(self.api.get_album, query['album_id'])
             if album_details.get('LABEL_NAME'):
                 album['label'] = album_details['LABEL_NAME']
         else:
-            album_details = self.api.get_album(query['album_id'])
+            album_details = self.call(self.api.get_album, query['album_id'])
             if album_details.get('label'):
                 album['label'] = album_details['label']
         
         return album
 
+    @staticmethod
+    def parse_gw_discography(query: dict, result: list) -> list:
+        """
+        Convert GW discography results into the release format used by Refresh
+        """
+        api_result = []
+        for r in result:
+            # Remove ID check to get compilations
+            if (r['ART_ID'] == str(query['artist_id']) and r['ARTISTS_ALBUMS_IS_OFFICIAL']) or (r['ART_ID'] == str(query['artist_id']) and config.allow_unofficial()) or config.allow_compilations():
+                # TYPE 0 - single, TYPE 1 - album, TYPE 2 - compilation, TYPE 3 - ep
+                if r['TYPE'] == '0':
+                    r['TYPE'] = "single"
+                elif r['TYPE'] == '1' and r['ART_ID'] != str(query['artist_id']):
+                    if not config.allow_featured_in():
+                        logger.debug(f"Featured In for {query['artist_name']} detected but are disabled in config")
+                        continue
+                    else:
+                        logger.debug(f"Featured In detected for artist {query['artist_name']}: {r['ALB_TITLE']}")
+                        r['TYPE'] = "album"
+                        # TODO set unique r['TYPE'] for FEATURED IN
+                elif r['TYPE'] == '2':
+                    if not config.allow_compilations():
+                        logger.debug(f"Compilation for {query['artist_name']} detected but are disabled in config")
+                        continue
+                    else:
+                        logger.debug(f"Compilation detected for artist {query['artist_name']}: {r['ALB_TITLE']}")
+                        r['TYPE'] = "album"
+                        # TODO set unique r['TYPE'] for COMPILATIONS
+                elif r['TYPE'] == '3':
+                    r['TYPE'] = "ep"
+                else:
+                    r['TYPE'] = "album"
+
+                if r['ORIGINAL_RELEASE_DATE'] != "0000-00-00":
+                    release_date = r['ORIGINAL_RELEASE_DATE']
+                elif r['PHYSICAL_RELEASE_DATE'] != "0000-00-00":
+                    release_date = r['PHYSICAL_RELEASE_DATE']
+                elif r['DIGITAL_RELEASE_DATE'] != "0000-00-00":
+                    release_date = r['DIGITAL_RELEASE_DATE']
+                else:
+                    # In the event of an unknown release date, set it to today's date
+                    # See album ID: 417403
+                    logger.warning(f"   [!] Found release without release date, assuming today: "
+                                   f"{query['artist_name']} - {r['ALB_TITLE']}")
+                    release_date = datetime.strftime(datetime.today(), "%Y-%m-%d")
+                
+                cover_art = f"https://e-cdns-images.dzcdn.net/images/cover/{r['ALB_PICTURE']}/500x500-00000-80-0-0.jpg"
+                album_url = f"https://www.deezer.com/album/{r['ALB_ID']}"
+                
+                api_result.append(
+                    {
+                        'id': int(r['ALB_ID']),
+                        'title': r['ALB_TITLE'],
+                        'release_date': release_date,
+                        'explicit_lyrics': r['EXPLICIT_ALBUM_CONTENT']['EXPLICIT_LYRICS_STATUS'],
+                        'record_type': r['TYPE'],
+                        'cover_big': cover_art,
+                        'link': album_url,
+                        'nb_tracks': r['NUMBER_TRACK'],
+                        }
+                )
+        return api_result
+
     def get_artist_albums(self, query: dict, limit: int = -1):
         """
         Return a list of dictionaries from API containing
+
+        query['fetch_failed'] is set if the discography could not be fetched.
         """
         self.debugger(f"Refreshing artist releases for {query['artist_name']} ({query['artist_id']})")
+        if self.get_cached_releases(query):
+            return query
         if self.platform == "deezer-gw":
             try:
-                result = self.api.get_artist_discography(art_id=query['artist_id'], limit=limit)['data']
+                result = self.call(self.api.get_artist_discography, art_id=query['artist_id'], limit=limit)['data']
             except deezer.errors.GWAPIError as e:
                 if "UNKNOWN" in str(e):
                     logger.debug(e)
@@ -189,82 +320,43 @@ class PlatformAPI:
                     logger.debug(e)
                     logger.error(f"An error occured while attempting to get the discography for "
                                  f"{query['artist_name']} ({query['artist_id']})")
+                    query['fetch_failed'] = True
                 query['releases'] = []
                 return query
             except json.decoder.JSONDecodeError:
-                logger.error(f"   [!] Empty response from API while getting data for discography for {query['artist_name']}, retrying...")
-                try:
-                    result = self.api.get_artist_discography(art_id=query['artist_id'], limit=limit)['data']
-                except json.decoder.JSONDecodeError:
-                    logger.error(f"   [!] API still sending empty response for discography for {query['artist_name']}")
-                    query['releases'] = []
-                    return query
-            api_result = []
-            for r in result:
-                # Remove ID check to get compilations
-                if (r['ART_ID'] == str(query['artist_id']) and r['ARTISTS_ALBUMS_IS_OFFICIAL']) or (r['ART_ID'] == str(query['artist_id']) and config.allow_unofficial()) or config.allow_compilations():
-                    # TYPE 0 - single, TYPE 1 - album, TYPE 2 - compilation, TYPE 3 - ep
-                    if r['TYPE'] == '0':
-                        r['TYPE'] = "single"
-                    elif r['TYPE'] == '1' and r['ART_ID'] != str(query['artist_id']):
-                        if not config.allow_featured_in():
-                            logger.debug(f"Featured In for {query['artist_name']} detected but are disabled in config")
-                            continue
-                        else:
-                            logger.debug(f"Featured In detected for artist {query['artist_name']}: {r['ALB_TITLE']}")
-                            r['TYPE'] = "album"
-                            # TODO set unique r['TYPE'] for FEATURED IN
-                    elif r['TYPE'] == '2':
-                        if not config.allow_compilations():
-                            logger.debug(f"Compilation for {query['artist_name']} detected but are disabled in config")
-                            continue
-                        else:
-                            logger.debug(f"Compilation detected for artist {query['artist_name']}: {r['ALB_TITLE']}")
-                            r['TYPE'] = "album"
-                            # TODO set unique r['TYPE'] for COMPILATIONS
-                    elif r['TYPE'] == '3':
-                        r['TYPE'] = "ep"
-                    else:
-                        r['TYPE'] = "album"
-
-                    if r['ORIGINAL_RELEASE_DATE'] != "0000-00-00":
-                        release_date = r['ORIGINAL_RELEASE_DATE']
-                    elif r['PHYSICAL_RELEASE_DATE'] != "0000-00-00":
-                        release_date = r['PHYSICAL_RELEASE_DATE']
-                    elif r['DIGITAL_RELEASE_DATE'] != "0000-00-00":
-                        release_date = r['DIGITAL_RELEASE_DATE']
-                    else:
-                        # In the event of an unknown release date, set it to today's date
-                        # See album ID: 417403
-                        logger.warning(f"   [!] Found release without release date, assuming today: "
-                                       f"{query['artist_name']} - {r['ALB_TITLE']}")
-                        release_date = datetime.strftime(datetime.today(), "%Y-%m-%d")
-                    
-                    cover_art = f"https://e-cdns-images.dzcdn.net/images/cover/{r['ALB_PICTURE']}/500x500-00000-80-0-0.jpg"
-                    album_url = f"https://www.deezer.com/album/{r['ALB_ID']}"
-                    
-                    api_result.append(
-                        {
-                            'id': int(r['ALB_ID']),
-                            'title': r['ALB_TITLE'],
-                            'release_date': release_date,
-                            'explicit_lyrics': r['EXPLICIT_ALBUM_CONTENT']['EXPLICIT_LYRICS_STATUS'],
-                            'record_type': r['TYPE'],
-                            'cover_big': cover_art,
-                            'link': album_url,
-                            'nb_tracks': r['NUMBER_TRACK'],
-                            }
-                    )
+                logger.error(f"   [!] API still sending empty response for discography for {query['artist_name']}")
+                query['releases'] = []
+                query['fetch_failed'] = True
+                return query
+            api_result = self.parse_gw_discography(query, result)
         else:
-            api_result = self.api.get_artist_albums(artist_id=query['artist_id'], limit=limit)['data']
+            api_result = self.call(self.api.get_artist_albums, artist_id=query['artist_id'], limit=limit)['data']
 
         query['releases'] = api_result
+        self.cache_releases(query)
         return query
 
-    @staticmethod
-    def get_playlist(query: int):
+    def get_cached_releases(self, query: dict) -> bool:
+        """
+        Populate query['releases'] from the response cache if the artist's
+        discography has not expired yet
+        """
+        if not self.cache:
+            return False
+        releases = self.cache.get(f"{self.platform}/discography", query['artist_id'], cache.discography_ttl)
+        if releases is None:
+            return False
+        self.debugger(f"Using cached releases for {query['artist_name']} ({query['artist_id']})")
+        query['releases'] = releases
+        return True
+
+    def cache_releases(self, query: dict):
+        if self.cache:
+            self.cache.set(f"{self.platform}/discography", query['artist_id'], query['releases'])
+
+    def get_playlist(self, query: int):
         try:
-            api_result = Deezer().api.get_playlist(query)
+            api_result = self.call(self.dz.api.get_playlist, query)
         except deezer.errors.PermissionException:
             logger.warning(f"   [!] Permission Denied: Playlist {query} is private")
             return
@@ -272,20 +364,14 @@ class PlatformAPI:
             logger.warning(f"   [!] Playlist ID {query} was not found")
             return
         except json.decoder.JSONDecodeError:
-            logger.error(f"   [!] Empty response from API while getting data for playlist ID {query}, retrying...")
-            try:
-                api_result = Deezer().api.get_playlist(query)
-            except json.decoder.JSONDecodeError:
-                logger.error(f"   [!] API still sending empty response while getting data for playlist ID {query}")
-                return
+            logger.error(f"   [!] API still sending empty response while getting data for playlist ID {query}")
+            return
         return {'id': query, 'title': api_result['title'],
                 'link': f"https://deezer.com/playlist/{str(api_result['id'])}"}
 
-    @staticmethod
-    def get_playlist_tracks(query: dict):
-        track_list = []
+    def get_playlist_tracks(self, query: dict):
         try:
-            api_result = Deezer().api.get_playlist_tracks(query['id'])
+            api_result = self.call(self.dz.api.get_playlist_tracks, query['id'])
         except deezer.errors.PermissionException:
             logger.warning(f"   [!] Permission Denied: Playlist {query['title']} ({query['id']}) is private")
             return
@@ -293,15 +379,16 @@ class PlatformAPI:
             logger.warning(f"   [!] Playlist ID {query} was not found")
             return
         except json.decoder.JSONDecodeError:
-            logger.error(f"   [!] Empty response from API while getting data for playlist ID {query['id']}")
-            try:
-                api_result = Deezer().api.get_playlist_tracks(query['id'])
-            except json.decoder.JSONDecodeError:
-                logger.error(f"   [!] API still sending empty response while getting data for playlist ID {query['id']}")
-                return
-        for track in api_result['data']:
+            logger.error(f"   [!] API still sending empty response while getting data for playlist ID {query['id']}")
+            return
+        query['tracks'] = self.parse_playlist_tracks(api_result['data'])
+        return query
+
+    @staticmethod
+    def parse_playlist_tracks(result: list) -> list:
+        track_list = []
+        for track in result:
             track_list.append({'id': track['id'], 'title': track['title'],
                                'artist_id': track['artist']['id'],
                                'artist_name': track['artist']['name']})
-        query['tracks'] = track_list
-        return query
+        return track_list
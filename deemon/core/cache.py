@@ -0,0 +1,152 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from deemon.core.config import Config as config
+from deemon.utils import performance, startup
+
+logger = logging.getLogger(__name__)
+
+# Writes made to the cache before they are committed
+COMMIT_EVERY = 100
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the process-wide ResponseCache or None if caching is disabled
+    """
+    global _cache
+    if not config.cache_enabled():
+        return
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ResponseCache()
+            except sqlite3.OperationalError as e:
+                logger.error(f"   [!] Unable to open response cache: {e}")
+                return
+        return _cache
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses stored in a separate SQLite database next
+    to deemon.db. Entries are keyed by endpoint and ID and expire after a
+    per-endpoint TTL; the least recently used entries are evicted once the
+    cache grows past cache_max_size.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or startup.get_cache_database()
+        self.bypass = False
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS response_cache ("
+                          "'endpoint' TEXT,"
+                          "'key' TEXT,"
+                          "'body' TEXT,"
+                          "'size' INTEGER,"
+                          "'fetched' INTEGER,"
+                          "'accessed' INTEGER,"
+                          "PRIMARY KEY (endpoint, key))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS 'response_cache_accessed' ON response_cache (accessed)")
+        self.conn.commit()
+        self.pending = 0
+        self.stats = {'hit': 0, 'miss': 0}
+        # Keep writes made by commands that never prune, or that are interrupted
+        atexit.register(self.flush)
+
+    def get(self, endpoint: str, key, ttl):
+        """
+        Return cached body for endpoint/key if it is younger than ttl seconds.
+        ttl may also be a function returning the TTL for a given body.
+        """
+        if self.bypass:
+            return
+        now = int(time.time())
+        with self.lock:
+            row = self.conn.execute("SELECT body, fetched FROM response_cache WHERE endpoint = ? AND key = ?",
+                                    (endpoint, str(key))).fetchone()
+            body = json.loads(row[0]) if row else None
+            if callable(ttl) and row:
+                ttl = ttl(body)
+            if not row or row[1] + ttl <= now:
+                self.stats['miss'] += 1
+                performance.increment("cache.miss")
+                return
+            self.conn.execute("UPDATE response_cache SET accessed = ? WHERE endpoint = ? AND key = ?",
+                              (now, endpoint, str(key)))
+            self._written()
+            self.stats['hit'] += 1
+        performance.increment("cache.hit")
+        return body
+
+    def set(self, endpoint: str, key, body):
+        body = json.dumps(body)
+        now = int(time.time())
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO response_cache (endpoint, key, body, size, fetched, accessed) "
+                              "VALUES (?, ?, ?, ?, ?, ?)", (endpoint, str(key), body, len(body), now, now))
+            self._written()
+
+    def _written(self):
+        """ Commit every COMMIT_EVERY writes; the caller must hold the lock """
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.conn.commit()
+            self.pending = 0
+
+    def flush(self):
+        """ Commit writes that have not been committed yet """
+        with self.lock:
+            if self.pending:
+                self.conn.commit()
+                self.pending = 0
+
+    def prune(self):
+        """
+        Remove least recently used entries until the cache is below its size cap
+        """
+        max_size = config.cache_max_size() * 1024 * 1024
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+            if total > max_size:
+                evict = []
+                for endpoint, key, size in self.conn.execute("SELECT endpoint, key, size FROM response_cache "
+                                                             "ORDER BY accessed"):
+                    if total <= max_size:
+                        break
+                    evict.append((endpoint, key))
+                    total -= size
+                self.conn.executemany("DELETE FROM response_cache WHERE endpoint = ? AND key = ?", evict)
+                logger.debug(f"Evicted {len(evict):,} entries from response cache")
+            self.conn.commit()
+            self.pending = 0
+        logger.debug(f"Response cache: {self.stats['hit']:,} hit(s), {self.stats['miss']:,} miss(es)")
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM response_cache")
+            self.conn.commit()
+            self.pending = 0
+
+
+def discography_ttl(releases: list) -> int:
+    """
+    Return TTL in seconds for an artist discography. Artists without a release
+    within dormant_after days are considered dormant and cached for longer;
+    active artists are not served from the cache unless discography_ttl is set.
+    """
+    if not releases:
+        return config.discography_ttl() * 3600
+    latest = max((x['release_date'] for x in releases if isinstance(x, dict) and x.get('release_date')), default="")
+    dormant_since = time.strftime("%Y-%m-%d", time.localtime(time.time() - config.dormant_after() * 86400))
+    if latest < dormant_since:
+        return config.dormant_ttl() * 3600
+    return config.discography_ttl() * 3600
@@ -1,30 +1,106 @@
 import re
 import logging
+import warnings
+from functools import lru_cache
+
 from deemon.core.config import Config as config
 
 logger = logging.getLogger(__name__)
 
+BRACKET_REGEX = re.compile(r'\(([^)]+)\)|\[([^)]+)]')
 
-def exclude_filtered_versions(albums: list) -> list:
-    """ Remove album versions containing specified text """
-    exclusion_patterns = config.exclusion_patterns()
-    exclusion_keywords = config.exclusion_keywords()
-    allowed = []
+# Patterns using backreferences can't be joined into a single alternation
+# without renumbering their groups
+BACKREFERENCE_REGEX = re.compile(r'\\[1-9]|\(\?P=')
+
+# Leading global flags, e.g. (?i), which can be rewritten as a scoped group
+GLOBAL_FLAGS_REGEX = re.compile(r'^\(\?([imsx]+)\)')
+
+
+class ExclusionMatcher:
+    """
+    Match album titles against exclusion patterns and keywords. Patterns are
+    joined into a single regex so non-matching titles are rejected in one
+    pass; individual patterns are only checked to report which ones matched.
+    """
+
+    def __init__(self, patterns: tuple, keywords: tuple):
+        self.patterns = [re.compile(p) for p in patterns]
+        self.keywords = list(keywords)
+        self.pattern_regex, self.standalone = self.combine(self.patterns)
+        self.keyword_regex = None
+        if self.keywords:
+            self.keyword_regex = re.compile("|".join(re.escape(k) for k in self.keywords))
+
+    def __bool__(self):
+        return bool(self.patterns or self.keywords)
+
+    @staticmethod
+    def combine(patterns: list) -> tuple:
+        """
+        Join patterns into one alternation. Returns the combined regex (or None)
+        and a list of patterns that must still be searched individually.
+        """
+        combined = []
+        standalone = []
+        for p in patterns:
+            if BACKREFERENCE_REGEX.search(p.pattern):
+                standalone.append(p)
+                continue
+            flags = GLOBAL_FLAGS_REGEX.match(p.pattern)
+            if flags:
+                combined.append(f"(?{flags.group(1)}:{p.pattern[flags.end():]})")
+            else:
+                combined.append(f"(?:{p.pattern})")
+        if not combined:
+            return None, standalone
+        with warnings.catch_warnings():
+            # Inline flags not at the start of the expression are deprecated
+            warnings.simplefilter("error")
+            try:
+                return re.compile("|".join(combined)), standalone
+            except (re.error, DeprecationWarning):
+                return None, patterns
 
-    if exclusion_keywords or exclusion_patterns:
+    def matches(self, title: str) -> list:
+        """ Return the patterns and keywords that exclude a title """
+        result = []
+        if self.patterns:
+            if (self.pattern_regex and self.pattern_regex.search(title)) or \
+                    any(p.search(title) for p in self.standalone):
+                result = [p.pattern for p in self.patterns if p.search(title)]
+        if self.keyword_regex:
+            keyword_search = BRACKET_REGEX.search(title.lower())
+            if keyword_search and self.keyword_regex.search(keyword_search.group()):
+                result += [k for k in self.keywords if k in keyword_search.group()]
+        return result
+
+    def filter(self, albums: list, key: str = 'title') -> list:
+        """ Remove albums whose title matches an exclusion """
+        if not self:
+            return albums
+        allowed = []
         for album in albums:
-            album_title = album['title']
-            exclusion_pattern_match = [p for p in exclusion_patterns if re.search(p, album_title)]
-            keyword_search = re.search(r'\(([^)]+)\)|\[([^)]+)]', album_title.lower())
-            exclusion_keyword_match = [e for e in exclusion_keywords if keyword_search and e in keyword_search.group()]
-            result = exclusion_pattern_match + exclusion_keyword_match
-            result = '", "'.join(result)
-
-            if exclusion_keyword_match or exclusion_pattern_match:
+            album_title = album[key]
+            result = self.matches(album_title)
+            if result:
+                result = '", "'.join(result)
                 logger.info(f"    Album \"{album_title}\" excluded by filter: \"{result}\"")
                 continue
-            else:
-                allowed.append(album)
+            allowed.append(album)
         return allowed
-    else:
-        return albums
+
+
+@lru_cache(maxsize=4)
+def _build_exclusion_matcher(patterns: tuple, keywords: tuple) -> ExclusionMatcher:
+    return ExclusionMatcher(patterns, keywords)
+
+
+def get_exclusion_matcher() -> ExclusionMatcher:
+    """ Return a matcher for the current exclusion settings, reused until they change """
+    return _build_exclusion_matcher(tuple(config.exclusion_patterns()), tuple(config.exclusion_keywords()))
+
+
+def exclude_filtered_versions(albums: list, key: str = 'title') -> list:
+    """ Remove album versions containing specified text """
+    return get_exclusion_matcher().filter(albums, key)
@@ -13,7 +13,8 @@ ALLOWED_VALUES = {
     'bitrate': {1: "128", 3: "320", 9: "FLAC"},
     'alerts': [True, False],
     'record_type': ['all', 'album', 'ep', 'single'],
-    'release_channel': ['stable', 'beta']
+    'release_channel': ['stable', 'beta'],
+    'api_backend': ['threaded', 'async']
 }
 
 DEFAULT_CONFIG = {
@@ -23,10 +24,28 @@ DEFAULT_CONFIG = {
     "query_limit": 5,
     "smart_search": True,
     "rollback_view_limit": 10,
+    "alert_release_limit": 250,
+    "metrics_path": "",
     "prompt_duplicates": False,
     "prompt_no_matches": True,
     "fast_api": True,
     "fast_api_threads": 25,
+    "api_backend": "threaded",
+    "async_api_concurrency": 200,
+    "api_rate_limit": 0,
+    "api_max_retries": 4,
+    "api_cache": {
+        "enable_cache": True,
+        "discography_ttl": 0,
+        "dormant_ttl": 168,
+        "dormant_after": 365,
+        "cache_max_size": 50,
+    },
+    "refresh_schedule": {
+        "enable_scheduler": True,
+        "warm_interval": 2,
+        "dormant_interval": 7,
+    },
     "exclusions": {
         "enable_exclusions": True,
         "patterns": [],
@@ -50,6 +69,7 @@ DEFAULT_CONFIG = {
         "arl": "",
         "check_account_status": True,
         "halt_download_on_error": False,
+        "download_threads": 1,
     },
     "smtp_settings": {
         "server": "",
@@ -413,6 +433,14 @@ class Config(object):
     def release_channel() -> str:
         return Config._CONFIG.get('release_channel')
 
+    @staticmethod
+    def alert_release_limit() -> int:
+        return Config._CONFIG['alert_release_limit']
+
+    @staticmethod
+    def metrics_path() -> str:
+        return Config._CONFIG['metrics_path']
+
     @staticmethod
     def rollback_view_limit() -> int:
         return Config._CONFIG.get('rollback_view_limit')
@@ -433,6 +461,63 @@ class Config(object):
     def fast_api_threads() -> int:
         return Config._CONFIG['fast_api_threads']
 
+    @staticmethod
+    def api_backend() -> str:
+        return Config._CONFIG['api_backend']
+
+    @staticmethod
+    def async_api_concurrency() -> int:
+        concurrency = Config._CONFIG['async_api_concurrency']
+        if concurrency < 1:
+            return 1
+        return concurrency
+
+    @staticmethod
+    def api_rate_limit() -> int:
+        rate = Config._CONFIG['api_rate_limit']
+        if rate < 0:
+            return 0
+        return rate
+
+    @staticmethod
+    def api_max_retries() -> int:
+        retries = Config._CONFIG['api_max_retries']
+        if retries < 0:
+            return 0
+        return retries
+
+    @staticmethod
+    def cache_enabled() -> bool:
+        return Config._CONFIG['api_cache']['enable_cache']
+
+    @staticmethod
+    def discography_ttl() -> int:
+        return Config._CONFIG['api_cache']['discography_ttl']
+
+    @staticmethod
+    def dormant_ttl() -> int:
+        return Config._CONFIG['api_cache']['dormant_ttl']
+
+    @staticmethod
+    def dormant_after() -> int:
+        return Config._CONFIG['api_cache']['dormant_after']
+
+    @staticmethod
+    def cache_max_size() -> int:
+        return Config._CONFIG['api_cache']['cache_max_size']
+
+    @staticmethod
+    def scheduler_enabled() -> bool:
+        return Config._CONFIG['refresh_schedule']['enable_scheduler']
+
+    @staticmethod
+    def warm_interval() -> int:
+        return Config._CONFIG['refresh_schedule']['warm_interval']
+
+    @staticmethod
+    def dormant_interval() -> int:
+        return Config._CONFIG['refresh_schedule']['dormant_interval']
+
     @staticmethod
     def allow_compilations() -> bool:
         return Config._CONFIG['new_releases']['include_compilations']
@@ -471,6 +556,13 @@ class Config(object):
     def halt_download_on_error() -> bool:
         return Config._CONFIG.get('deemix').get('halt_download_on_error')
 
+    @staticmethod
+    def download_threads() -> int:
+        threads = Config._CONFIG.get('deemix').get('download_threads')
+        if threads < 1:
+            return 1
+        return threads
+
     @staticmethod
     def smart_search() -> bool:
         return Config._CONFIG.get('smart_search')
@@ -1,7 +1,10 @@
 import logging
 import sqlite3
+import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
 from packaging.version import parse as parse_version
@@ -12,12 +15,52 @@ from deemon.utils import startup, performance, dates
 
 logger = logging.getLogger(__name__)
 
+# Connections are shared by every Database instance within a thread so that
+# worker pools each get their own connection and nothing else opens more.
+_local = threading.local()
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Rows written per executemany() call by bulk inserts
+INSERT_BATCH_SIZE = 1000
+
+
+def get_connection(path):
+    """
+    Return the connection to path for the current thread, opening it if needed
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(str(path))
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.row_factory = Database.dict_factory
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        connections[str(path)] = conn
+    return conn
+
+
+def close_connections():
+    """
+    Commit and close all connections opened by the current thread
+    """
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.commit()
+        conn.close()
+    _local.connections = {}
+
 
 class Database(object):
 
     def __init__(self):
-        self.conn = None
-        self.cursor = None
         self.db = startup.get_database()
 
         if not Path(self.db).exists():
@@ -29,31 +72,69 @@ class Database(object):
     def __enter__(self):
         return self
 
-    def __exit__(self):
+    def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
     @staticmethod
     def dict_factory(cursor, row):
-        d = {}
-        for idx, col in enumerate(cursor.description):
-            d[col[0]] = row[idx]
-        return d
+        return dict(zip([col[0] for col in cursor.description], row))
+
+    @property
+    def conn(self):
+        return get_connection(self.db)
+
+    @property
+    def cursor(self):
+        cursors = getattr(_local, 'cursors', None)
+        if cursors is None:
+            cursors = _local.cursors = {}
+        conn = self.conn
+        cursor = cursors.get(id(conn))
+        if cursor is None or cursor.connection is not conn:
+            cursor = cursors[id(conn)] = conn.cursor()
+        return cursor
 
     def connect(self):
         try:
-            self.conn = sqlite3.connect(self.db)
-            self.conn.row_factory = self.dict_factory
-            self.cursor = self.conn.cursor()
+            self.conn
         except sqlite3.OperationalError as e:
             logger.error(f"Error opening database: {e}")
 
     def close(self):
-        if self.conn:
-            self.conn.commit()
-            self.conn.close()
+        """
+        Commit pending changes. The shared connection is left open for other
+        Database instances on this thread.
+        """
+        self.commit()
 
     def commit(self):
-        self.conn.commit()
+        if not getattr(_local, 'transaction_depth', 0):
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group all writes made on this thread into a single transaction. Calls
+        to commit() inside the block are deferred until it exits.
+        """
+        _local.transaction_depth = getattr(_local, 'transaction_depth', 0) + 1
+        try:
+            yield self
+        except BaseException:
+            _local.transaction_depth -= 1
+            if not _local.transaction_depth:
+                self.conn.rollback()
+            raise
+        else:
+            _local.transaction_depth -= 1
+            self.commit()
+
+    def checkpoint(self):
+        """
+        Write the WAL back into the main database file, e.g. before a backup
+        """
+        self.commit()
+        self.query("PRAGMA wal_checkpoint(TRUNCATE)")
 
     def commit_and_close(self):
         self.commit()
@@ -133,8 +214,52 @@ class Database(object):
                    "'profile_id' INTEGER DEFAULT 1,"
                    "PRIMARY KEY('id' AUTOINCREMENT))")
 
+        self.query("CREATE TABLE refresh_schedule ("
+                   "'artist_id' INTEGER,"
+                   "'profile_id' INTEGER DEFAULT 1,"
+                   "'tier' TEXT,"
+                   "'next_due' INTEGER DEFAULT 0,"
+                   "unique(artist_id, profile_id))")
+
+        self.query("CREATE TABLE refresh_runs ("
+                   "'id' INTEGER,"
+                   "'profile_id' INTEGER DEFAULT 1,"
+                   "'trans_id' INTEGER,"
+                   "'started' INTEGER,"
+                   "'completed' INTEGER DEFAULT 0,"
+                   "PRIMARY KEY('id' AUTOINCREMENT))")
+
+        self.query("CREATE TABLE refresh_run_artists ("
+                   "'run_id' INTEGER,"
+                   "'artist_id' INTEGER,"
+                   "'releases' TEXT,"
+                   "unique(run_id, artist_id))")
+
+        self.query("CREATE TABLE refresh_run_releases ("
+                   "'run_id' INTEGER,"
+                   "'album_id' INTEGER,"
+                   "unique(run_id, album_id))")
+
+        self.query("CREATE TABLE library_scan ("
+                   "'path' TEXT,"
+                   "'mtime' INTEGER,"
+                   "'size' INTEGER,"
+                   "'artist' TEXT,"
+                   "'album' TEXT,"
+                   "'title' TEXT,"
+                   "'error' TEXT,"
+                   "PRIMARY KEY('path'))")
+
+        self.query("CREATE TABLE artist_matches ("
+                   "'name' TEXT,"
+                   "'artist_id' INTEGER,"
+                   "'artist_name' TEXT,"
+                   "'checked' INTEGER,"
+                   "PRIMARY KEY('name'))")
+
         self.query("CREATE UNIQUE INDEX 'idx_property' ON 'deemon' ('property')")
         self.query("CREATE INDEX 'artist' ON 'releases' ('artist_id', 'profile_id')")
+        self.create_indexes()
         self.query(f"INSERT INTO 'deemon' ('property', 'value') VALUES ('version', '{__dbversion__}')")
         self.query("INSERT OR REPLACE INTO 'deemon' ('property', 'value') VALUES ('latest_ver', '')")
         self.query("INSERT INTO 'deemon' ('property', 'value') VALUES ('last_update_check', 0)")
@@ -142,12 +267,30 @@ class Database(object):
         self.query("INSERT INTO 'profiles' ('name') VALUES ('default')")
         self.commit()
 
+    def create_indexes(self):
+        """
+        Create indexes used by lookups on monitored artists, playlist tracks,
+        releases and by rollback
+        """
+        self.query("CREATE INDEX IF NOT EXISTS 'monitor_artist_id' ON 'monitor' ('profile_id', 'artist_id')")
+        self.query("CREATE INDEX IF NOT EXISTS 'monitor_artist_name' ON 'monitor' "
+                   "('profile_id', 'artist_name' COLLATE NOCASE)")
+        self.query("CREATE INDEX IF NOT EXISTS 'playlist_track' ON 'playlist_tracks' "
+                   "('playlist_id', 'track_id', 'profile_id')")
+        self.query("CREATE INDEX IF NOT EXISTS 'release_date' ON 'releases' ('profile_id', 'album_release')")
+        self.query("CREATE INDEX IF NOT EXISTS 'release_future' ON 'releases' ('profile_id', 'future_release')")
+        self.query("CREATE INDEX IF NOT EXISTS 'monitor_trans_id' ON 'monitor' ('trans_id', 'profile_id')")
+        self.query("CREATE INDEX IF NOT EXISTS 'releases_trans_id' ON 'releases' ('trans_id', 'profile_id')")
+        self.query("CREATE INDEX IF NOT EXISTS 'playlists_trans_id' ON 'playlists' ('trans_id', 'profile_id')")
+        self.query("CREATE INDEX IF NOT EXISTS 'playlist_tracks_trans_id' ON 'playlist_tracks' "
+                   "('trans_id', 'profile_id')")
+
     def get_latest_ver(self):
-        return self.query("SELECT value FROM deemon WHERE property = 'latest_ver'").fetchone()['value']
+        return self.query_scalar("SELECT value FROM deemon WHERE property = 'latest_ver'")
 
     def get_db_version(self):
         try:
-            version = self.query(f"SELECT value FROM deemon WHERE property = 'version'").fetchone()['value']
+            version = self.query_scalar(f"SELECT value FROM deemon WHERE property = 'version'")
         except sqlite3.OperationalError:
             version = '0.0.0'
 
@@ -221,11 +364,100 @@ class Database(object):
             self.commit()
             logger.debug(f"Database upgraded to version 3.7")
 
+        if current_ver < parse_version("3.8"):
+            self.query("CREATE TABLE IF NOT EXISTS refresh_schedule ("
+                       "'artist_id' INTEGER,"
+                       "'profile_id' INTEGER DEFAULT 1,"
+                       "'tier' TEXT,"
+                       "'next_due' INTEGER DEFAULT 0,"
+                       "unique(artist_id, profile_id))")
+            self.query("INSERT OR REPLACE INTO 'deemon' ('property', 'value') VALUES ('version', '3.8')")
+            self.commit()
+            logger.debug(f"Database upgraded to version 3.8")
+
+        if current_ver < parse_version("3.9"):
+            self.create_indexes()
+            self.query("ANALYZE")
+            self.query("INSERT OR REPLACE INTO 'deemon' ('property', 'value') VALUES ('version', '3.9')")
+            self.commit()
+            logger.debug(f"Database upgraded to version 3.9")
+
+        if current_ver < parse_version("3.10"):
+            self.query("CREATE TABLE IF NOT EXISTS refresh_runs ("
+                       "'id' INTEGER,"
+                       "'profile_id' INTEGER DEFAULT 1,"
+                       "'trans_id' INTEGER,"
+                       "'started' INTEGER,"
+                       "'completed' INTEGER DEFAULT 0,"
+                       "PRIMARY KEY('id' AUTOINCREMENT))")
+            self.query("CREATE TABLE IF NOT EXISTS refresh_run_artists ("
+                       "'run_id' INTEGER,"
+                       "'artist_id' INTEGER,"
+                       "'releases' TEXT,"
+                       "unique(run_id, artist_id))")
+            self.query("INSERT OR REPLACE INTO 'deemon' ('property', 'value') VALUES ('version', '3.10')")
+            self.commit()
+            logger.debug(f"Database upgraded to version 3.10")
+
+        if current_ver < parse_version("3.11"):
+            self.query("CREATE TABLE IF NOT EXISTS library_scan ("
+                       "'path' TEXT,"
+                       "'mtime' INTEGER,"
+                       "'size' INTEGER,"
+                       "'artist' TEXT,"
+                       "'album' TEXT,"
+                       "'title' TEXT,"
+                       "'error' TEXT,"
+                       "PRIMARY KEY('path'))")
+            self.query("INSERT OR REPLACE INTO 'deemon' ('property', 'value') VALUES ('version', '3.11')")
+            self.commit()
+            logger.debug(f"Database upgraded to version 3.11")
+
+        if current_ver < parse_version("3.12"):
+            self.query("CREATE TABLE IF NOT EXISTS artist_matches ("
+                       "'name' TEXT,"
+                       "'artist_id' INTEGER,"
+                       "'artist_name' TEXT,"
+                       "'checked' INTEGER,"
+                       "PRIMARY KEY('name'))")
+            self.query("INSERT OR REPLACE INTO 'deemon' ('property', 'value') VALUES ('version', '3.12')")
+            self.commit()
+            logger.debug(f"Database upgraded to version 3.12")
+
+        if current_ver < parse_version("3.13"):
+            self.query("CREATE TABLE IF NOT EXISTS refresh_run_releases ("
+                       "'run_id' INTEGER,"
+                       "'album_id' INTEGER,"
+                       "unique(run_id, album_id))")
+            self.query("INSERT OR REPLACE INTO 'deemon' ('property', 'value') VALUES ('version', '3.13')")
+            self.commit()
+            logger.debug(f"Database upgraded to version 3.13")
+
     def query(self, query, values=None):
         if values is None:
             values = {}
         return self.cursor.execute(query, values)
 
+    def query_tuples(self, query, values=None):
+        """
+        Execute query returning plain tuples instead of dictionaries
+        """
+        if values is None:
+            values = {}
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        return cursor.execute(query, values)
+
+    def query_column(self, query, values=None) -> list:
+        """ Return the first column of every row """
+        return [x[0] for x in self.query_tuples(query, values)]
+
+    def query_scalar(self, query, values=None):
+        """ Return the first column of the first row or None """
+        result = self.query_tuples(query, values).fetchone()
+        if result:
+            return result[0]
+
     def reset_future(self, album_id):
         logger.debug("Clearing future_release flag from " + str(album_id))
         values = {'album_id': album_id, 'profile_id': config.profile_id()}
@@ -249,8 +481,7 @@ class Database(object):
 
     def get_all_monitored_playlist_ids(self):
         vals = {'profile_id': config.profile_id()}
-        query = self.query("SELECT id FROM playlists WHERE profile_id = :profile_id", vals).fetchall()
-        return [v for x in query for v in x.values()]
+        return self.query_column("SELECT id FROM playlists WHERE profile_id = :profile_id", vals)
 
     def get_all_monitored_playlists(self):
         vals = {'profile_id': config.profile_id()}
@@ -289,6 +520,23 @@ class Database(object):
             query = "SELECT album_id, future_release FROM 'releases' WHERE profile_id = :profile_id"
         return self.query(query, sql_values).fetchall()
 
+    def get_seen_album_ids(self) -> set:
+        """
+        Return album IDs stored for the active profile, excluding future releases
+        """
+        values = {'profile_id': config.profile_id()}
+        return set(self.query_column("SELECT album_id FROM 'releases' WHERE profile_id = :profile_id "
+                                     "AND IFNULL(future_release, 0) = 0", values))
+
+    def get_stats(self) -> dict:
+        values = {'profile_id': config.profile_id()}
+        return self.query("SELECT "
+                          "(SELECT COUNT(*) FROM monitor WHERE profile_id = :profile_id) AS artists, "
+                          "(SELECT COUNT(*) FROM playlists WHERE profile_id = :profile_id) AS playlists, "
+                          "(SELECT COUNT(*) FROM releases WHERE profile_id = :profile_id) AS releases, "
+                          "(SELECT COUNT(*) FROM releases WHERE profile_id = :profile_id "
+                          "AND future_release = 1) AS future", values).fetchone()
+
     def get_future_releases(self):
         vals = {'profile_id': config.profile_id()}
         return self.query("SELECT * FROM releases "
@@ -299,6 +547,15 @@ class Database(object):
         query = "SELECT * FROM 'playlist_tracks' WHERE playlist_id = :playlist_id AND profile_id = :profile_id"
         return self.query(query, sql_values).fetchall()
 
+    def get_playlist_track_ids(self, playlist_id) -> set:
+        """
+        Return a set of track IDs already stored for a playlist by the active profile
+        """
+        values = {'playlist_id': playlist_id, 'profile_id': config.profile_id()}
+        query = self.query("SELECT track_id FROM 'playlist_tracks' WHERE playlist_id = :playlist_id "
+                           "AND profile_id = :profile_id", values)
+        return {x['track_id'] for x in query.fetchall()}
+
     def get_track_from_playlist(self, playlist_id, track_id):
         values = {'pid': playlist_id, 'tid': track_id, 'profile_id': config.profile_id()}
         query = "SELECT * FROM 'playlist_tracks' WHERE track_id = :tid AND playlist_id = :pid AND profile_id = :profile_id"
@@ -322,6 +579,7 @@ class Database(object):
         values = {'id': id, 'profile_id': config.profile_id()}
         self.query("DELETE FROM monitor WHERE artist_id = :id AND profile_id = :profile_id", values)
         self.query("DELETE FROM releases WHERE artist_id = :id AND profile_id = :profile_id", values)
+        self.query("DELETE FROM refresh_schedule WHERE artist_id = :id AND profile_id = :profile_id", values)
         self.commit()
 
     def remove_monitored_playlists(self, id: int = None):
@@ -362,6 +620,111 @@ class Database(object):
         self.cursor.executemany(sql, values)
         self.set_all_playlists_refreshed()
 
+    def get_release_cadence(self, since: str):
+        """
+        Return latest release date, number of releases since a given date and
+        whether a future release is pending for each artist
+        """
+        values = {'since': since, 'profile_id': config.profile_id()}
+        return self.query("SELECT artist_id, MAX(album_release) AS latest_release, "
+                          "SUM(album_release >= :since) AS recent_releases, "
+                          "MAX(future_release) AS future_release FROM releases "
+                          "WHERE profile_id = :profile_id GROUP BY artist_id", values).fetchall()
+
+    def get_refresh_schedule(self):
+        values = {'profile_id': config.profile_id()}
+        return self.query("SELECT artist_id, tier, next_due FROM refresh_schedule "
+                          "WHERE profile_id = :profile_id", values).fetchall()
+
+    def set_refresh_schedule(self, values):
+        sql = (f"INSERT OR REPLACE INTO refresh_schedule ('artist_id', 'profile_id', 'tier', 'next_due') "
+               f"VALUES (:artist_id, {config.profile_id()}, :tier, :next_due)")
+        self.cursor.executemany(sql, values)
+
+    def start_refresh_run(self, artist_ids: list) -> int:
+        """
+        Record a new refresh run and the artists it will refresh. Progress
+        from any interrupted run is discarded.
+        """
+        values = {'profile_id': config.profile_id(), 'started': int(time.time())}
+        self.query("DELETE FROM refresh_run_artists WHERE run_id IN "
+                   "(SELECT id FROM refresh_runs WHERE profile_id = :profile_id AND completed = 0)", values)
+        self.query("DELETE FROM refresh_run_releases WHERE run_id IN "
+                   "(SELECT id FROM refresh_runs WHERE profile_id = :profile_id AND completed = 0)", values)
+        self.query("DELETE FROM refresh_runs WHERE profile_id = :profile_id AND completed = 0", values)
+        run_id = self.query("INSERT INTO refresh_runs ('profile_id', 'started') "
+                            "VALUES (:profile_id, :started)", values).lastrowid
+        self.cursor.executemany("INSERT INTO refresh_run_artists ('run_id', 'artist_id') VALUES (?, ?)",
+                                [(run_id, x) for x in artist_ids])
+        self.commit()
+        return run_id
+
+    def get_interrupted_refresh_run(self):
+        values = {'profile_id': config.profile_id()}
+        return self.query("SELECT * FROM refresh_runs WHERE profile_id = :profile_id AND completed = 0 "
+                          "ORDER BY id DESC LIMIT 1", values).fetchone()
+
+    def get_refresh_run_artists(self, run_id: int):
+        values = {'run_id': run_id}
+        return self.query("SELECT artist_id, releases FROM refresh_run_artists WHERE run_id = :run_id",
+                          values).fetchall()
+
+    def checkpoint_refresh_run(self, run_id: int, values: list):
+        """
+        Save new releases found for each artist so an interrupted run can be
+        resumed without fetching them again
+        """
+        self.cursor.executemany(f"UPDATE refresh_run_artists SET releases = :releases "
+                                f"WHERE run_id = {int(run_id)} AND artist_id = :artist_id", values)
+        self.commit()
+
+    def complete_refresh_run(self, run_id: int):
+        values = {'run_id': run_id, 'completed': int(time.time()), 'trans_id': config.transaction_id()}
+        self.query("UPDATE refresh_runs SET completed = :completed, trans_id = :trans_id WHERE id = :run_id", values)
+        self.query("DELETE FROM refresh_run_artists WHERE run_id = :run_id", values)
+        self.query("DELETE FROM refresh_run_releases WHERE run_id = :run_id", values)
+
+    def add_refresh_run_release(self, run_id: int, album_id: int):
+        """ Record a release of a refresh run as downloaded so resuming the run skips it """
+        values = {'run_id': run_id, 'album_id': album_id}
+        self.query("INSERT OR IGNORE INTO refresh_run_releases ('run_id', 'album_id') "
+                   "VALUES (:run_id, :album_id)", values)
+        self.commit()
+
+    def get_refresh_run_releases(self, run_id: int) -> set:
+        """ Return the IDs of releases already downloaded by a refresh run """
+        values = {'run_id': run_id}
+        return set(self.query_column("SELECT album_id FROM refresh_run_releases WHERE run_id = :run_id", values))
+
+    def get_library_scan(self) -> dict:
+        """
+        Return cached tag metadata for library files keyed by path
+        """
+        return {row[0]: row for row in self.query_tuples("SELECT path, mtime, size, artist, album, title, error "
+                                                         "FROM library_scan")}
+
+    def set_library_scan(self, values: list):
+        self.cursor.executemany("INSERT OR REPLACE INTO library_scan ('path', 'mtime', 'size', 'artist', "
+                                "'album', 'title', 'error') VALUES (:path, :mtime, :size, :artist, :album, "
+                                ":title, :error)", values)
+        self.commit()
+
+    def remove_library_scan(self, paths: list):
+        self.cursor.executemany("DELETE FROM library_scan WHERE path = ?", [(x,) for x in paths])
+        self.commit()
+
+    def get_artist_matches(self) -> dict:
+        """
+        Return artists previously matched to a search, keyed by lowercase
+        search term. artist_id is None if no artist was found.
+        """
+        return {row['name']: row for row in self.query("SELECT * FROM artist_matches")}
+
+    def set_artist_matches(self, values: list):
+        self.executemany_batched("INSERT OR REPLACE INTO artist_matches ('name', 'artist_id', 'artist_name', "
+                                 "'checked') VALUES (:name, :artist_id, :artist_name, :checked)", values)
+        self.commit()
+
     def show_new_releases(self, from_date_ts, now_ts):
         today_date = datetime.utcfromtimestamp(now_ts).strftime('%Y-%m-%d')
         from_date = datetime.utcfromtimestamp(from_date_ts).strftime('%Y-%m-%d')
@@ -380,6 +743,10 @@ class Database(object):
         self.query("DELETE FROM playlists")
         self.query("DELETE FROM playlist_tracks")
         self.query("DELETE FROM transactions")
+        self.query("DELETE FROM refresh_schedule")
+        self.query("DELETE FROM refresh_run_artists")
+        self.query("DELETE FROM refresh_run_releases")
+        self.query("DELETE FROM refresh_runs")
         self.commit()
         logger.info("Database has been reset")
 
@@ -411,6 +778,7 @@ class Database(object):
         self.query("DELETE FROM releases WHERE profile_id = :profile_id", vals)
         self.query("DELETE FROM playlists WHERE profile_id = :profile_id", vals)
         self.query("DELETE FROM playlist_tracks WHERE profile_id = :profile_id", vals)
+        self.query("DELETE FROM refresh_schedule WHERE profile_id = :profile_id", vals)
         self.query("DELETE FROM profiles WHERE id = :profile_id", vals)
         self.commit()
 
@@ -433,7 +801,7 @@ class Database(object):
         self.commit()
 
     def last_update_check(self):
-        return self.query("SELECT value FROM 'deemon' WHERE property = 'last_update_check'").fetchone()['value']
+        return self.query_scalar("SELECT value FROM 'deemon' WHERE property = 'last_update_check'")
 
     def set_last_update_check(self):
         now = int(time.time())
@@ -460,20 +828,20 @@ class Database(object):
         transactions = self.query("SELECT id FROM transactions WHERE profile_id = :profile_id "
                                   f"ORDER BY id DESC LIMIT {rollback}", vals).fetchall()
         for t in transactions:
-            vals = {'id': t['id'], 'profile_id': config.profile_id()}
-            self.query(f"DELETE FROM monitor WHERE trans_id = :id AND profile_id = :profile_id", vals)
-            self.query(f"DELETE FROM releases WHERE trans_id = :id AND profile_id = :profile_id", vals)
-            self.query(f"DELETE FROM playlist_tracks WHERE trans_id = :id AND profile_id = :profile_id", vals)
-            self.query(f"DELETE FROM transactions WHERE id = :id AND profile_id = :profile_id", vals)
-            self.commit()
+            self.rollback_refresh(t['id'])
 
     def rollback_refresh(self, rollback: int):
         vals = {'rollback': rollback, 'profile_id': config.profile_id()}
-        self.query(f"DELETE FROM monitor WHERE trans_id = {rollback} AND profile_id = :profile_id", vals)
-        self.query(f"DELETE FROM releases WHERE trans_id = {rollback} AND profile_id = :profile_id", vals)
-        self.query(f"DELETE FROM playlist_tracks WHERE trans_id = {rollback} AND profile_id = :profile_id", vals)
-        self.query(f"DELETE FROM transactions WHERE id = {rollback} AND profile_id = :profile_id", vals)
-        self.commit()
+        with self.transaction():
+            # Artists losing releases must be refreshed again on the next run
+            self.query("DELETE FROM refresh_schedule WHERE profile_id = :profile_id AND artist_id IN "
+                       "(SELECT artist_id FROM releases WHERE trans_id = :rollback AND profile_id = :profile_id "
+                       "UNION SELECT artist_id FROM monitor WHERE trans_id = :rollback AND profile_id = :profile_id)",
+                       vals)
+            self.query("DELETE FROM monitor WHERE trans_id = :rollback AND profile_id = :profile_id", vals)
+            self.query("DELETE FROM releases WHERE trans_id = :rollback AND profile_id = :profile_id", vals)
+            self.query("DELETE FROM playlist_tracks WHERE trans_id = :rollback AND profile_id = :profile_id", vals)
+            self.query("DELETE FROM transactions WHERE id = :rollback AND profile_id = :profile_id", vals)
 
     def set_artist_refreshed(self, id):
         vals = {'id': id, 'profile_id': config.profile_id()}
@@ -488,6 +856,14 @@ class Database(object):
         self.query("INSERT OR REPLACE INTO deemon (property, value) VALUES ('latest_ver', :version)", vals)
         return self.commit()
 
+    def get_account_type(self):
+        return self.query_scalar("SELECT value FROM deemon WHERE property = 'account_type'")
+
+    def set_account_type(self, value):
+        vals = {'value': value}
+        self.query("INSERT OR REPLACE INTO deemon (property, value) VALUES ('account_type', :value)", vals)
+        return self.commit()
+
     def get_release_channel(self):
         return self.query("SELECT value FROM deemon WHERE property = 'release_channel'").fetchone()
 
@@ -527,8 +903,7 @@ class Database(object):
 
     def get_all_monitored_artist_ids(self):
         values = {"profile_id": config.profile_id()}
-        query = self.query("SELECT artist_id FROM monitor WHERE profile_id = :profile_id", values).fetchall()
-        return [v for x in query for v in x.values()]
+        return self.query_column("SELECT artist_id FROM monitor WHERE profile_id = :profile_id", values)
 
     @performance.timeit
     def get_monitored(self):
@@ -545,13 +920,24 @@ class Database(object):
         values = {"profile_id": config.profile_id()}
         return self.query("SELECT * FROM playlists WHERE profile_id = :profile_id AND refreshed = 0", values).fetchall()
 
+    def executemany_batched(self, sql: str, values):
+        """
+        Run sql for each item in values, INSERT_BATCH_SIZE rows at a time
+        """
+        values = iter(values)
+        while True:
+            batch = list(islice(values, INSERT_BATCH_SIZE))
+            if not batch:
+                break
+            self.cursor.executemany(sql, batch)
+
     def fast_monitor(self, values):
-        self.cursor.executemany(
+        self.executemany_batched(
             "INSERT OR REPLACE INTO monitor (artist_id, artist_name, bitrate, record_type, alerts, profile_id, download_path, trans_id) VALUES (:id, :name, :bitrate, :record_type, :alerts, :profile_id, :download_path, :trans_id)",
             values)
 
     def fast_monitor_playlist(self, values):
-        self.cursor.executemany(
+        self.executemany_batched(
             "INSERT OR REPLACE INTO playlists (id, title, url, bitrate, alerts, profile_id, download_path, trans_id, monitor_artists) VALUES (:id, :title, :link, :bitrate, :alerts, :profile_id, :download_path, :trans_id, :monitor_artists)",
             values)
 
@@ -561,6 +947,9 @@ class Database(object):
             values)
 
     def remove_by_name(self, values):
+        self.cursor.executemany(f"DELETE FROM refresh_schedule WHERE profile_id = {config.profile_id()} AND "
+                                f"artist_id IN (SELECT artist_id FROM monitor WHERE profile_id = {config.profile_id()} "
+                                f"AND artist_name = ?)", values)
         self.cursor.executemany(f"DELETE FROM monitor WHERE profile_id = {config.profile_id()} AND artist_name = ?",
                                 values)
         self.cursor.executemany(f"DELETE FROM releases WHERE profile_id = {config.profile_id()} AND artist_name = ?",
@@ -570,6 +959,8 @@ class Database(object):
     def remove_by_id(self, values):
         self.cursor.executemany(f"DELETE FROM monitor WHERE profile_id = {config.profile_id()} AND artist_id = ?",
                                 values)
+        self.cursor.executemany(f"DELETE FROM refresh_schedule WHERE profile_id = {config.profile_id()} "
+                                f"AND artist_id = ?", values)
         self.cursor.executemany(f"DELETE FROM releases WHERE profile_id = {config.profile_id()} AND artist_id = ?",
                                 values)
         self.commit()
@@ -1,4 +1,5 @@
 import logging
+import os
 import sys
 from pathlib import Path
 
@@ -14,9 +15,10 @@ from deezer.api import APIError
 from deezer.gw import GWAPIError
 from deezer.utils import map_user_playlist, LyricsStatus, map_track
 
-from deemon.core import notifier
+from deemon.core import notifier, session
 from deemon.core.config import Config as config
 from deemon.core.db import Database
+from deemon.utils import performance
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +37,13 @@ class DeemixLogListener:
                         logger.info("[X] Exiting due to halt_download_on_error being set to True in config.")
                         sys.exit()
                         
+        if key == "updateQueue" and isinstance(value, dict) and value.get('downloaded'):
+            performance.increment("download.tracks")
+            try:
+                performance.increment("download.bytes", os.path.getsize(value['downloadPath']))
+            except (KeyError, OSError):
+                pass
+
         log_string = formatListener(key, value)
         if config.debug_mode():
             if log_string: logger.debug(f"[DEEMIX] {log_string}")
@@ -45,6 +54,7 @@ class DeemixInterface:
         logger.debug("Initializing deemix library")
         self.db = Database()
         self.dz = Deezer()
+        self.arl = None
 
         if config.deemix_path() == "":
             self.config_dir = localpaths.getConfigFolder()
@@ -96,16 +106,28 @@ class DeemixInterface:
             config.set('deezer_quality', 'lq', validate=False)
 
     def verify_arl(self, arl):
-        if not self.dz.login_via_arl(arl):
+        # Reuse the session from the account type check if this ARL was already used
+        dz = session.get_session(arl)
+        if not dz:
             print("FAILED")
             logger.debug(f"ARL Failed: {arl}")
             return False
+        self.dz = dz
         self.deezer_acct_type()
+        self.arl = arl
             
         print("OK")
         logger.debug("ARL is valid")
         return True
 
+    def login_with_verified_arl(self, arl):
+        """ Login using an ARL that has already been verified by another session """
+        if self.dz.login_via_arl(arl):
+            self.arl = arl
+            return True
+        logger.debug("Unable to login using previously verified ARL")
+        return False
+
     def login(self):
         failed_logins = 0
         logger.debug("Looking for ARL...")
@@ -171,14 +193,18 @@ class DeemixInterface:
         totalSize = len(playlistTracksAPI)
         playlistAPI['nb_tracks'] = totalSize
         collection = []
+        #
+        # BEGIN DEEMON PATCH
+        #
+        known_tracks = self.db.get_playlist_track_ids(playlistAPI['id'])
+        #
+        # END DEEMON PATCH
+        #
         for pos, trackAPI in enumerate(playlistTracksAPI, start=1):
             #
             # BEGIN DEEMON PATCH
             #
-            vals = {'track_id': trackAPI['SNG_ID'], 'playlist_id': playlistAPI['id']}
-            sql = "SELECT * FROM 'playlist_tracks' WHERE track_id = :track_id AND playlist_id = :playlist_id"
-            result = self.db.query(sql, vals).fetchone()
-            if result:
+            if int(trackAPI['SNG_ID']) in known_tracks:
                 continue
             #
             # END DEEMON PATCH
@@ -15,13 +15,52 @@ from deemon.core.config import Config as config
 
 logger = logging.getLogger(__name__)
 
+RELEASE_LIST_SPACER = """
+            </ul>
+            <p style="font-size: 14px; line-height: 140%;">&nbsp;</p>
+        """
+
+RELEASE_LIST_HEADER = """
+			<div class="album date">
+				<span class="album date badge">
+					{release_date}
+				</span>
+			</div>
+            """
+
+RELEASE_LIST_ITEM = """
+            <div class="album body">
+				<div class="albumart">
+					<img src="{cover}">
+				</div>
+				<div class="albuminfo">
+					<div class="albumtitle">
+						<a href="{url}">{album}</a>
+					</div>
+					<div>
+						<div class="artistname">{artist}</div>
+						<span>{album_info}</span>
+					</div>
+				</div>
+			</div>
+                """
+
+RELEASE_LIST_SUMMARY = """
+			<div class="album date">
+				<span class="album date badge">
+					...and {count:,} more release(s)
+				</span>
+			</div>
+            """
+
 
 class Notify:
 
     def __init__(self, new_releases: list = None):
-        logger.debug(f"Sending notification for {new_releases} release(s)")
         self.subject = "deemon Notification"
-        self.releases = new_releases
+        self.releases = new_releases or []
+        self.release_count = sum(len(x['releases']) for x in self.releases)
+        logger.debug(f"Sending notification for {self.release_count} release(s)")
 
     def send(self, body=None, test=False):
         """
@@ -103,18 +142,49 @@ class Notify:
         msg.set_content("Your Deezer subscription appears to have expired.")
         self.send(msg)
 
+    def limited_releases(self):
+        """
+        Yield (release date, releases) newest first, stopping once
+        alert_release_limit releases have been included
+        """
+        remaining = config.alert_release_limit() or self.release_count
+        for day in sorted(self.releases, key=lambda x: x['release_date'], reverse=True):
+            if remaining <= 0:
+                break
+            albums = day['releases'][:remaining]
+            remaining -= len(albums)
+            yield day['release_date'], albums
+
     def plaintext_message(self) -> str:
         """
         Plaintext version of email to send
         """
-        message = "The following new releases were detected:\n\n"
-        for release in self.releases:
-            release_date_ts = datetime.strptime(release["release_date"], "%Y-%m-%d")
+        message = ["The following new releases were detected:\n\n"]
+        shown = 0
+        for release_date, albums in self.limited_releases():
+            release_date_ts = datetime.strptime(release_date, "%Y-%m-%d")
             release_date_str = datetime.strftime(release_date_ts, "%A, %B %-d")
-            message += f"\n{release_date_str}\n"
-            for album in release["releases"]:
-                message += f"+ {album['artist']} - {album['album']}\n"
-        return message
+            message.append(f"\n{release_date_str}\n")
+            message.extend(f"+ {album['artist']} - {album['album']}\n" for album in albums)
+            shown += len(albums)
+        if shown < self.release_count:
+            message.append(f"\n...and {self.release_count - shown:,} more release(s)\n")
+        return "".join(message)
+
+    @staticmethod
+    def html_release_item(album: dict) -> str:
+        if album['record_type'].lower() == "ep":
+            record_type = "EP"
+        else:
+            record_type = album['record_type'].title()
+
+        if not album['track_num']:
+            album_info = record_type
+        else:
+            album_info = f"{record_type} | {album['track_num']} track(s)"
+
+        return RELEASE_LIST_ITEM.format(cover=album['cover'], url=album['url'], album=album['album'],
+                                        artist=album['artist'], album_info=album_info)
 
     def html_new_releases(self):
 
@@ -122,65 +192,21 @@ class Notify:
         py_version = f"python {platform.python_version()}"
         sys_version = f"{platform.system()} {platform.release()}"
 
-        new_release_list_spacer = f"""
-            </ul>
-            <p style="font-size: 14px; line-height: 140%;">&nbsp;</p>
-        """
-
-        all_new_releases = ""
-
-        self.releases = sorted(self.releases, key=lambda x: x['release_date'], reverse=True)
-
-        new_release_count = 0
-        
-        for release in self.releases:
-
-            if all_new_releases != "":
-                all_new_releases += new_release_list_spacer
+        release_lists = []
+        shown = 0
 
-            release_date_ts = datetime.strptime(release["release_date"], "%Y-%m-%d")
+        for release_date, albums in self.limited_releases():
+            release_date_ts = datetime.strptime(release_date, "%Y-%m-%d")
             release_date_str = datetime.strftime(release_date_ts, "%A, %B %d").replace(" 0", " ")
+            release_lists.append(RELEASE_LIST_HEADER.format(release_date=release_date_str) +
+                                 "".join(self.html_release_item(album) for album in albums))
+            shown += len(albums)
 
-            new_release_list_header = f"""
-			<div class="album date">
-				<span class="album date badge">
-					{release_date_str}
-				</span>
-			</div>
-            """
-
-            new_release_list_item = ""
-
-            for album in release["releases"]:
-                new_release_count += 1
-                if album['record_type'].lower() == "ep":
-                    record_type = "EP"
-                else:
-                    record_type = album['record_type'].title()
-            
-                if not album['track_num']:
-                    album_info = record_type
-                else:
-                    album_info = f"{record_type} | {album['track_num']} track(s)"
-            
-                new_release_list_item += f"""
-            <div class="album body">
-				<div class="albumart">
-					<img src="{album['cover']}">
-				</div>
-				<div class="albuminfo">
-					<div class="albumtitle">
-						<a href="{album['url']}">{album['album']}</a>
-					</div>
-					<div>
-						<div class="artistname">{album['artist']}</div>
-						<span>{album_info}</span>
-					</div>
-				</div>
-			</div>
-                """
+        if shown < self.release_count:
+            release_lists.append(RELEASE_LIST_SUMMARY.format(count=self.release_count - shown))
 
-            all_new_releases += new_release_list_header + new_release_list_item
+        all_new_releases = RELEASE_LIST_SPACER.join(release_lists)
+        new_release_count = self.release_count
 
         if new_release_count > 1:
             self.subject = f"{str(new_release_count)} new releases found!"
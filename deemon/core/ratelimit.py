@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import random
+import sys
+import threading
+import time
+
+import requests
+from deezer.errors import GWAPIError
+
+from deemon.core.config import Config as config
+from deemon.utils import performance
+
+logger = logging.getLogger(__name__)
+
+# GW error messages that indicate we are being throttled rather than a bad request
+THROTTLE_ERRORS = ("QUOTA", "RATE_LIMIT", "TOO_MANY")
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter(max_concurrency: int):
+    """
+    Return the process-wide RateLimiter, creating it on first use. A caller
+    allowing more concurrency raises the limit and the current window with it.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(config.api_rate_limit(), max_concurrency, config.api_max_retries())
+        elif max_concurrency > _limiter.max_concurrency:
+            _limiter.raise_max_concurrency(max_concurrency)
+        return _limiter
+
+
+def is_throttled(error: Exception) -> bool:
+    """ Return True if an exception looks like an empty/throttled API response """
+    if isinstance(error, (json.decoder.JSONDecodeError, requests.exceptions.ConnectionError,
+                          requests.exceptions.Timeout, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, GWAPIError):
+        return any(x in str(error).upper() for x in THROTTLE_ERRORS)
+    # aiohttp is optional; its errors can only be raised once the async backend has imported it
+    aiohttp = sys.modules.get("aiohttp")
+    if aiohttp:
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status == 429 or error.status >= 500
+        return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ServerDisconnectedError))
+    return False
+
+
+class RateLimiter:
+    """
+    Token bucket limiting requests per second combined with an AIMD
+    concurrency window: every successful call grows the window slowly and
+    every throttled call halves it.
+    """
+
+    def __init__(self, rate: float, max_concurrency: int, max_retries: int = 4):
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.concurrency = float(max_concurrency)
+        self.tokens = float(rate) if rate else 0.0
+        self.last_refill = time.monotonic()
+        self.in_flight = 0
+        self.lock = threading.Condition()
+        self.metrics = {'calls': 0, 'retried': 0, 'throttled': 0, 'dropped': 0}
+
+    def raise_max_concurrency(self, max_concurrency: int):
+        """ Raise the limit, growing the window by the same amount so throttling is kept """
+        with self.lock:
+            self.concurrency += max_concurrency - self.max_concurrency
+            self.max_concurrency = max_concurrency
+
+    def _try_acquire(self) -> float:
+        """ Take a slot and a token if available, otherwise return seconds to wait """
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.rate, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+        if self.in_flight >= max(1, int(self.concurrency)):
+            return 0.05
+        if self.rate and self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        if self.rate:
+            self.tokens -= 1
+        self.in_flight += 1
+        self.metrics['calls'] += 1
+        return 0
+
+    def acquire(self):
+        with self.lock:
+            while True:
+                wait = self._try_acquire()
+                if not wait:
+                    return
+                self.lock.wait(wait)
+
+    async def acquire_async(self):
+        while True:
+            with self.lock:
+                wait = self._try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, throttled: bool = False):
+        with self.lock:
+            self.in_flight -= 1
+            if throttled:
+                self.metrics['throttled'] += 1
+                performance.increment("api.throttled")
+                self.concurrency = max(1.0, self.concurrency / 2)
+                logger.debug(f"API throttled, concurrency reduced to {int(self.concurrency)}")
+            else:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+            self.lock.notify_all()
+
+    def backoff(self, attempt: int) -> float:
+        """ Exponential backoff with full jitter, capped at 30 seconds """
+        return random.uniform(0, min(30, 0.5 * 2 ** attempt))
+
+    def _retry_or_raise(self, error: Exception, attempt: int):
+        self.release(throttled=is_throttled(error))
+        if not is_throttled(error):
+            raise error
+        if attempt >= self.max_retries:
+            with self.lock:
+                self.metrics['dropped'] += 1
+            raise error
+        with self.lock:
+            self.metrics['retried'] += 1
+        performance.increment("api.retries")
+        delay = self.backoff(attempt)
+        logger.debug(f"Retrying API call in {delay:.2f}s after error: {type(error).__name__}")
+        return delay
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func under the limiter, retrying throttled calls. The last
+        exception is raised once retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                time.sleep(self._retry_or_raise(e, attempt))
+                attempt += 1
+            else:
+                self.release()
+                return result
+
+    async def call_async(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            await self.acquire_async()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._retry_or_raise(e, attempt))
+                attempt += 1
+            else:
+                self.release()
+                return result
+
+    def summary(self) -> str:
+        return (f"{self.metrics['calls']} calls, {self.metrics['retried']} retried, "
+                f"{self.metrics['throttled']} throttled, {self.metrics['dropped']} dropped "
+                f"(concurrency: {int(self.concurrency)}/{self.max_concurrency})")
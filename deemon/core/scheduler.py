@@ -0,0 +1,82 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+from deemon.core.config import Config as config
+
+logger = logging.getLogger(__name__)
+
+# Artists with a release within HOT_DAYS or at least HOT_RELEASES releases in
+# the last year are refreshed every run. Artists without a release in
+# WARM_DAYS are considered dormant.
+HOT_DAYS = 90
+HOT_RELEASES = 4
+WARM_DAYS = 730
+
+# Allow refreshes scheduled at a fixed time of day to drift slightly
+SCHEDULE_SLACK = 3600
+
+
+class RefreshScheduler:
+    """
+    Assign monitored artists to refresh tiers based on how often they have
+    released music and keep track of when each artist is next due.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def interval(tier: str) -> int:
+        """ Return number of days between refreshes for a tier """
+        if tier == "warm":
+            return config.warm_interval()
+        if tier == "dormant":
+            return config.dormant_interval()
+        return 0
+
+    @staticmethod
+    def get_tier(cadence: dict, now: datetime) -> str:
+        if not cadence or not cadence['latest_release']:
+            return "dormant"
+        if cadence['future_release']:
+            return "hot"
+        if cadence['latest_release'] >= (now - timedelta(HOT_DAYS)).strftime("%Y-%m-%d"):
+            return "hot"
+        if cadence['recent_releases'] >= HOT_RELEASES:
+            return "hot"
+        if cadence['latest_release'] >= (now - timedelta(WARM_DAYS)).strftime("%Y-%m-%d"):
+            return "warm"
+        return "dormant"
+
+    def due(self, artists: list) -> list:
+        """
+        Return only artists whose next refresh is due. Artists that have never
+        been scheduled are always due.
+        """
+        now = int(time.time())
+        schedule = {x['artist_id']: x['next_due'] for x in self.db.get_refresh_schedule()}
+        due = [x for x in artists if schedule.get(x['artist_id'], 0) <= now]
+        if len(due) < len(artists):
+            logger.info(f":: Skipping {len(artists) - len(due):,} artist(s) not yet due for refresh "
+                        f"(use --full to refresh all)")
+        return due
+
+    def update(self, artist_ids: list):
+        """
+        Recalculate tier and next due time for artists that were just refreshed
+        """
+        now = datetime.now()
+        since = (now - timedelta(365)).strftime("%Y-%m-%d")
+        cadence = {x['artist_id']: x for x in self.db.get_release_cadence(since)}
+        values = []
+        tiers = {'hot': 0, 'warm': 0, 'dormant': 0}
+        for artist_id in set(artist_ids):
+            tier = self.get_tier(cadence.get(artist_id), now)
+            tiers[tier] += 1
+            interval = self.interval(tier) * 86400
+            next_due = int(now.timestamp()) + interval - SCHEDULE_SLACK if interval else 0
+            values.append({'artist_id': artist_id, 'tier': tier, 'next_due': next_due})
+        self.db.set_refresh_schedule(values)
+        logger.debug(f"Refresh schedule updated: {tiers['hot']:,} hot, {tiers['warm']:,} warm, "
+                     f"{tiers['dormant']:,} dormant")
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from deezer import Deezer
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a cached account type is verified against Deezer again
+ACCOUNT_TYPE_TTL = 86400
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def arl_hash(arl: str) -> str:
+    """ Identify an ARL without storing the ARL itself """
+    return hashlib.sha256(arl.encode()).hexdigest()[:16]
+
+
+def get_session(arl: str = None):
+    """
+    Return the shared Deezer session for an ARL, logging in on first use.
+    Without an ARL the shared anonymous session is returned. Returns None if
+    login with the ARL failed; failed logins are not cached so the next call
+    tries again.
+    """
+    key = arl_hash(arl) if arl else None
+    with _sessions_lock:
+        if key not in _sessions:
+            dz = Deezer()
+            if arl and not dz.login_via_arl(arl):
+                logger.debug("Unable to login to Deezer using ARL")
+                return None
+            _sessions[key] = dz
+        return _sessions[key]
+
+
+def account_type(dz: Deezer) -> str:
+    """ Return 'hifi', 'premium' or 'free' for a logged in session """
+    user = dz.get_session()['current_user']
+    if user.get('can_stream_lossless'):
+        return "hifi"
+    if user.get('can_stream_hq'):
+        return "premium"
+    return "free"
+
+
+def get_cached_account_type(db, arl: str):
+    """ Return account type stored for this ARL if it has not expired """
+    cached = db.get_account_type()
+    if not cached:
+        return
+    try:
+        cached = json.loads(cached)
+    except json.decoder.JSONDecodeError:
+        return
+    if cached.get('arl') != arl_hash(arl) or cached.get('checked', 0) + ACCOUNT_TYPE_TTL <= time.time():
+        return
+    return cached.get('type')
+
+
+def set_cached_account_type(db, arl: str, value: str):
+    db.set_account_type(json.dumps({'arl': arl_hash(arl), 'type': value, 'checked': int(time.time())}))
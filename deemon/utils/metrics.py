@@ -0,0 +1,105 @@
+import logging
+import os
+import time
+from pathlib import Path
+
+from deemon.core.config import Config as config
+from deemon.utils import performance
+
+logger = logging.getLogger(__name__)
+
+# Gauges written for every run: (metric name, help text, counter name)
+RUN_GAUGES = [
+    ("deemon_artists_scanned", "Artists refreshed", "refresh.artists"),
+    ("deemon_releases_found", "New releases found", "refresh.new_releases"),
+    ("deemon_releases_queued", "Releases sent to deemix", "download.queued"),
+    ("deemon_releases_downloaded", "Releases downloaded without error", "download.downloaded"),
+    ("deemon_releases_failed", "Releases that failed to download", "download.failed"),
+    ("deemon_tracks_downloaded", "Tracks written by deemix", "download.tracks"),
+    ("deemon_downloaded_bytes", "Size of tracks written by deemix", "download.bytes"),
+    ("deemon_api_retries", "API calls retried after being throttled", "api.retries"),
+    ("deemon_api_throttled", "API calls that were throttled", "api.throttled"),
+    ("deemon_cache_hits", "API responses served from cache", "cache.hit"),
+    ("deemon_cache_misses", "API responses not found in cache", "cache.miss"),
+]
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict) -> str:
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def histogram_lines(name: str, hist: dict, labels: dict) -> list:
+    lines = []
+    cumulative = 0
+    for le, count in hist['buckets'].items():
+        cumulative += count
+        lines.append(f"{name}_bucket{format_labels({**labels, 'le': le})} {cumulative}")
+    lines.append(f"{name}_count{format_labels(labels)} {hist['count']}")
+    lines.append(f"{name}_sum{format_labels(labels)} {hist['total']}")
+    return lines
+
+
+def render(command: str, duration: float) -> str:
+    """ Return metrics collected during this run in OpenMetrics text format """
+    counters = performance.get_counters()
+    histograms = performance.get_histograms()
+    labels = {'command': command}
+    lines = []
+
+    def gauge(name: str, help_text: str, samples: list):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"# HELP {name} {help_text}")
+        for sample_labels, value in samples:
+            lines.append(f"{name}{format_labels(sample_labels)} {value}")
+
+    gauge("deemon_last_run_timestamp_seconds", "Time the last run finished", [(labels, round(time.time(), 3))])
+    gauge("deemon_run_duration_seconds", "Duration of the last run", [(labels, round(duration, 3))])
+    for name, help_text, counter in RUN_GAUGES:
+        gauge(name, help_text, [(labels, counters.get(counter, 0))])
+
+    endpoints = sorted(x[4:] for x in histograms if x.startswith("api."))
+    gauge("deemon_api_calls", "API calls by endpoint",
+          [({**labels, 'endpoint': x}, histograms[f"api.{x}"]['count']) for x in endpoints])
+    gauge("deemon_api_errors", "API calls that failed after retries by endpoint",
+          [({**labels, 'endpoint': x}, counters.get(f"api.{x}.errors", 0)) for x in endpoints])
+
+    lines.append("# TYPE deemon_api_request_duration_seconds histogram")
+    lines.append("# HELP deemon_api_request_duration_seconds API call latency including retries")
+    for x in endpoints:
+        lines.extend(histogram_lines("deemon_api_request_duration_seconds", histograms[f"api.{x}"],
+                                     {**labels, 'endpoint': x}))
+
+    lines.append("# TYPE deemon_phase_duration_seconds histogram")
+    lines.append("# HELP deemon_phase_duration_seconds Time spent in each phase of a run")
+    for name, hist in sorted(histograms.items()):
+        if not name.startswith("api."):
+            lines.extend(histogram_lines("deemon_phase_duration_seconds", hist, {**labels, 'phase': name}))
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write(command: str):
+    """
+    Write metrics for this run to deemon_<command>.prom in metrics_path, for
+    node_exporter's textfile collector. Does nothing if metrics_path is unset.
+    """
+    if not config.metrics_path():
+        return
+    started = config.get('start_time') or time.time()
+    path = Path(config.metrics_path()) / f"deemon_{command}.prom"
+    # Write to a temporary file first so the collector never reads a partial file
+    tmp_path = path.with_suffix(".prom.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render(command, time.time() - started))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"   [!] Unable to write metrics to {path}: {e}")
+    else:
+        logger.debug(f"Metrics written to {path}")
@@ -1,8 +1,26 @@
+import cProfile
+import json
 import logging
+import os
+import threading
 import time
+from bisect import bisect_left
+from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+# Upper bounds, in seconds, of latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+# Trace events and profiler are only collected during a profiled run
+_trace = None
+_trace_start = 0.0
+_profiler = None
+
 
 def timeit(method):
     def timed(*args, **kwargs):
@@ -20,4 +38,120 @@ def operation_time(start_time):
     end_time = int(time.time())
     duration = end_time - start_time
     output = time.strftime("%H:%M:%S", time.gmtime(duration))
-    logger.info(f"Operation completed in {output}")
\ No newline at end of file
+    logger.info(f"Operation completed in {output}")
+
+
+class Histogram:
+    """ Count of observed durations per latency bucket """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.buckets[bisect_left(LATENCY_BUCKETS, value)] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'total': round(self.total, 6),
+            'mean': round(self.total / self.count, 6) if self.count else 0,
+            'max': round(self.max, 6),
+            'buckets': dict(zip([str(x) for x in LATENCY_BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+def observe(name: str, seconds: float):
+    """ Record a duration in the histogram for name """
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram()
+        _histograms[name].observe(seconds)
+
+
+def increment(name: str, value: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get_histograms() -> dict:
+    with _lock:
+        return {k: v.to_dict() for k, v in _histograms.items()}
+
+
+def get_counters() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+@contextmanager
+def span(name: str, category: str = "phase", **args):
+    """
+    Time a block of work. The duration is always added to the histogram for
+    name; during a profiled run it is also written to the trace.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        observe(name, end - start)
+        if _trace is not None:
+            event = {'name': name, 'cat': category, 'ph': "X", 'pid': os.getpid(),
+                     'tid': threading.get_ident(), 'ts': round((start - _trace_start) * 1e6),
+                     'dur': round((end - start) * 1e6)}
+            if args:
+                event['args'] = args
+            with _lock:
+                _trace.append(event)
+
+
+def start_profiling(cprofile: bool = False):
+    """
+    Start collecting trace events and, optionally, cProfile data for the
+    main thread
+    """
+    global _trace, _trace_start, _profiler
+    _trace = []
+    _trace_start = time.perf_counter()
+    if cprofile:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def write_profile(trace_path, cprofile_path=None):
+    """
+    Write collected spans as a Chrome trace (chrome://tracing, Perfetto)
+    with histograms and counters included under otherData
+    """
+    global _profiler
+    if _profiler:
+        _profiler.disable()
+        if cprofile_path:
+            _profiler.dump_stats(cprofile_path)
+            logger.info(f":: cProfile data saved to {cprofile_path}")
+        _profiler = None
+    with _lock:
+        events = list(_trace or [])
+    trace = {
+        'traceEvents': events,
+        'displayTimeUnit': "ms",
+        'otherData': {'histograms': get_histograms(), 'counters': get_counters()},
+    }
+    with open(trace_path, "w") as f:
+        json.dump(trace, f)
+    logger.info(f":: Profile saved to {trace_path}")
+
+
+def log_summary():
+    """ Log time spent per span and counters at debug level """
+    for name, hist in sorted(get_histograms().items(), key=lambda x: x[1]['total'], reverse=True):
+        logger.debug(f"{name}: {hist['count']:,} call(s), {hist['total']:.3f}s total, "
+                     f"{hist['mean'] * 1000:.1f}ms mean, {hist['max'] * 1000:.1f}ms max")
+    for name, value in sorted(get_counters().items()):
+        logger.debug(f"{name}: {value:,}")
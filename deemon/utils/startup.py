@@ -3,11 +3,13 @@ import os
 import sys
 from pathlib import Path
 
-import requests
 from packaging.version import parse as parse_version
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for PyPI/GitHub before giving up on an update check
+UPDATE_CHECK_TIMEOUT = 5
+
 
 def get_appdata_root():
 
@@ -64,6 +66,10 @@ def get_database():
     return get_appdata_dir() / 'deemon.db'
 
 
+def get_cache_database():
+    return get_appdata_dir() / 'cache.db'
+
+
 def get_log_file():
     """
     Get path to log file
@@ -72,11 +78,15 @@ def get_log_file():
 
 
 def get_latest_version(release_type):
+    import requests
+
     latest_ver = "https://pypi.org/pypi/deemon/json"
 
     try:
-        response = requests.get(latest_ver)
-    except requests.exceptions.ConnectionError:
+        response = requests.get(latest_ver, timeout=UPDATE_CHECK_TIMEOUT)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.debug(f"Unable to check for updates: {e}")
         return
 
     latest_stable = parse_version(response.json()['info']['version'])
@@ -94,10 +104,12 @@ def get_latest_version(release_type):
         return latest_stable
 
 def get_changelog(ver: str):
+    import requests
+
     try:
         response = requests.get("https://api.github.com/repos/digitalec/"
-                                "deemon/releases")
-    except requests.exceptions.ConnectionError:
+                                "deemon/releases", timeout=UPDATE_CHECK_TIMEOUT)
+    except requests.exceptions.RequestException:
         return print("Unable to reach GitHub API")
     
     for release in response.json():
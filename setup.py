@@ -26,6 +26,9 @@ setup(
     include_package_data=True,
     python_requires=">=3.8",
     install_requires=required,
+    extras_require={
+        'async': ['aiohttp'],
+    },
     url="https://github.com/digitalec/deemon",
     entry_points = {
         "console_scripts": ["deemon=deemon.__main__:main"],